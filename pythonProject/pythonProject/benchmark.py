@@ -0,0 +1,232 @@
+# benchmark.py
+"""Замеры горячих путей: разбор xlsx, импорт, выгрузка, рассылка напоминаний и задачи пользователя.
+
+Каждый размер прогоняется на свежей временной tasks.db, рабочая база не трогается:
+
+    python benchmark.py --sizes 1000,10000,100000 --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2
+
+С --baseline результат сравнивается с сохранённым прогоном; код возврата 1 —
+какой-то замер стал медленнее больше чем на threshold.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from functools import partial
+from io import BytesIO
+from typing import Dict, List
+
+from openpyxl import Workbook
+
+import database
+from utils import outbox
+from utils.delivery import DeliveryEngine
+from utils.excel import IMPORT_COLUMNS, PARSE_CHUNK_SIZE, export_tasks_to_excel, parse_excel_from_bytes
+from utils.scheduler import REMINDER_FORMAT, send_reminders
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+# Задач на преподавателя в синтетических данных
+TASKS_PER_USER = 20
+# Сколько пользователей опрашивает замер get_tasks_by_user_id
+LOOKUP_SAMPLE = 200
+# Telegram id синтетических пользователей начинаются отсюда
+TG_ID_BASE = 10 ** 9
+
+PRACTICES = ("Учебная практика", "Производственная практика", "Преддипломная практика", "Научная практика")
+WORDS = ("отчёт", "дневник", "программа", "график", "характеристика", "договор", "защита", "презентация",
+         "оценка", "индивидуальное", "задание", "аттестационный", "лист", "руководитель", "кафедра")
+
+
+class FakeBot:
+    """Заглушка aiogram.Bot для рассылки: ничего не отправляет, только считает и по желанию ждёт."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+def build_xlsx(rows: int, seed: int = 0) -> bytes:
+    """Синтетическая выгрузка в формате импорта: rows задач у rows / TASKS_PER_USER преподавателей."""
+    rnd = random.Random(seed)
+    users = max(1, rows // TASKS_PER_USER)
+    today = datetime.now()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Задачи")
+    ws.append(list(IMPORT_COLUMNS))
+    for i in range(rows):
+        user = i % users
+        end_date = today + timedelta(days=rnd.randint(8, 120))
+        ws.append([
+            f"Преподаватель{user} Имя{user % 97} Отчество{user % 89}",
+            end_date.strftime("%d.%m.%Y"),
+            rnd.choice(PRACTICES),
+            " ".join(rnd.sample(WORDS, 6)) + f" №{i}",
+            (end_date - timedelta(days=30)).strftime("%Y-%m-%d"),
+            f"teacher{user}",
+            f"+7 900 {user:07d}",
+        ])
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+async def _link_users_and_schedule():
+    """Привязывает всех пользователей к Telegram и делает все напоминания наступившими."""
+    past = (datetime.now() - timedelta(minutes=1)).strftime(REMINDER_FORMAT)
+    async with database.connection() as db:
+        await db.execute("UPDATE users SET tg_user_id = ? + id WHERE tg_user_id IS NULL", (TG_ID_BASE,))
+        await db.execute("UPDATE tasks SET next_reminder = ?", (past,))
+        await db.commit()
+        async with db.execute("SELECT id FROM users WHERE tg_user_id >= ?", (TG_ID_BASE,)) as cursor:
+            return [row["id"] for row in await cursor.fetchall()]
+
+
+def _measure(results: Dict, name: str, started: float, rows: int):
+    seconds = time.perf_counter() - started
+    results[name] = {
+        "seconds": round(seconds, 6),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+    }
+
+
+async def run_size(rows: int, seed: int = 0) -> Dict[str, Dict]:
+    """Один полный прогон на свежей базе; возвращает {замер: {seconds, rows, rows_per_sec}}."""
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    database.DB_PATH = os.path.join(workdir, "tasks.db")
+    database.forget_cached_user(None)
+    try:
+        await database.init_db()
+        payload = build_xlsx(rows, seed)
+
+        started = time.perf_counter()
+        tasks = parse_excel_from_bytes(BytesIO(payload))
+        _measure(results, "parse_excel_from_bytes", started, len(tasks))
+
+        chunks = [tasks[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(tasks), PARSE_CHUNK_SIZE)]
+        started = time.perf_counter()
+        added = await database.add_tasks_from_excel(chunks)
+        _measure(results, "add_tasks_from_excel", started, added)
+
+        export_rows = await database.get_all_tasks_for_export()
+        started = time.perf_counter()
+        path = export_tasks_to_excel(export_rows)
+        _measure(results, "export_tasks_to_excel", started, len(export_rows))
+        os.remove(path)
+
+        user_ids = await _link_users_and_schedule()
+        sample = random.Random(seed).sample(user_ids, min(LOOKUP_SAMPLE, len(user_ids)))
+        found = 0
+        started = time.perf_counter()
+        for user_id in sample:
+            found += len(await database.get_tasks_by_user_id(user_id))
+        _measure(results, "get_tasks_by_user_id", started, found)
+        results["get_tasks_by_user_id"]["calls"] = len(sample)
+
+        bot = FakeBot()
+        started = time.perf_counter()
+        report = await send_reminders(bot)
+        _measure(results, "send_reminders", started, report.sent)
+    finally:
+        await database.close_db()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _best(runs: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+    """Из нескольких повторов берёт самый быстрый по каждому замеру: он меньше всего зашумлён."""
+    best = {}
+    for run in runs:
+        for name, result in run.items():
+            if name not in best or result["seconds"] < best[name]["seconds"]:
+                best[name] = result
+    return best
+
+
+async def run_benchmarks(sizes, repeat: int = 1) -> Dict:
+    # Пределы Telegram здесь не нужны: меряется наш код, а не 30 сообщений в секунду
+    outbox.DeliveryEngine = partial(DeliveryEngine, global_rate=10 ** 9, per_chat_rate=10 ** 9)
+    results = {}
+    for size in sizes:
+        runs = []
+        for attempt in range(repeat):
+            print(f"⏱ {size} строк, прогон {attempt + 1}/{repeat}...", file=sys.stderr)
+            runs.append(await run_size(size, seed=attempt))
+        results[str(size)] = _best(runs)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Строки отчёта о замерах, ставших медленнее базовых больше чем на threshold (0.2 = 20%)."""
+    regressions = []
+    for size, benchmarks in current["results"].items():
+        for name, result in benchmarks.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base or not base["seconds"]:
+                continue
+            change = result["seconds"] / base["seconds"] - 1
+            line = f"{name} @ {size}: {base['seconds']:.4f}s -> {result['seconds']:.4f}s ({change:+.1%})"
+            print(("❌ " if change > threshold else "   ") + line, file=sys.stderr)
+            if change > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры импорта, выгрузки, напоминаний и выборки задач")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="размеры синтетических данных через запятую")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов на размер, берётся лучший")
+    parser.add_argument("--output", help="куда сохранить JSON (по умолчанию — stdout)")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    # Бот печатает свои сообщения в stdout; там должен остаться только JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run_benchmarks(sizes, max(1, args.repeat)))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"❌ Замедлились замеры: {len(regressions)}", file=sys.stderr)
+            sys.exit(1)
+        print("✅ Регрессий нет", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
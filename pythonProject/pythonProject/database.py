@@ -1,12 +1,516 @@
 # database.py
+import asyncio
 import aiosqlite
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import AsyncIterable, Callable, Iterable, List, Dict, Optional, Union
+
+from utils.cache import MISSING, TTLCache
+from utils.metrics import timed_db
+from utils.querylog import QUERY_LOG
 
 DB_PATH = Path("tasks.db")
+# Записи пользователей по tg id: кнопки админки и меню читают одного и того же пользователя по нескольку раз
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60
+_user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# === Пул соединений ===
+
+POOL_SIZE = 4
+# Сколько секунд запрос ждёт свободное соединение, прежде чем упасть с ошибкой
+POOL_TIMEOUT = 30.0
+STATEMENT_CACHE_SIZE = 256
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class ConnectionPool:
+    """Набор долгоживущих соединений aiosqlite.
+
+    Прагмы выставляются один раз при открытии, а кэш подготовленных
+    выражений sqlite3 живёт вместе с соединением и переиспользуется между запросами.
+    """
+
+    def __init__(self, path, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._connections: List[aiosqlite.Connection] = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    async def open(self):
+        for _ in range(self.size):
+            db = await _connect(self.path)
+            self._connections.append(db)
+            self._idle.put_nowait(db)
+
+    async def close(self):
+        for db in self._connections:
+            await db.close()
+        self._connections.clear()
+        self._idle = asyncio.Queue()
+
+    @asynccontextmanager
+    async def acquire(self):
+        try:
+            db = await asyncio.wait_for(self._idle.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(
+                f"Нет свободного соединения с БД за {self.timeout:g} с: заняты все {self.size} "
+                f"(увеличьте DB_POOL_SIZE)"
+            ) from None
+        try:
+            yield db
+        finally:
+            await db.finish_pending()
+            # Незакоммиченные изменения не должны достаться следующему запросу
+            if db.in_transaction:
+                await db.rollback()
+            self._idle.put_nowait(db)
+
+
+async def _connect(path):
+    db = await aiosqlite.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    db.row_factory = aiosqlite.Row
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+    # Каждое выражение учитывается в журнале запросов (utils/querylog.py)
+    return QUERY_LOG.wrap(db)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_size = POOL_SIZE
+_pool_timeout = POOL_TIMEOUT
+
+
+def configure_pool(size: Optional[int] = None, timeout: Optional[float] = None):
+    """Размер пула и ожидание свободного соединения; действует на следующий open_db/init_db."""
+    global _pool_size, _pool_timeout
+    _pool_size = size or POOL_SIZE
+    _pool_timeout = timeout or POOL_TIMEOUT
+
+
+@asynccontextmanager
+async def connection():
+    """Выдаёт соединение из общего пула на время запроса."""
+    if _pool is None:
+        raise RuntimeError("Пул соединений не открыт: сначала вызовите init_db()")
+    async with _pool.acquire() as db:
+        yield db
+
+
+@asynccontextmanager
+async def dedicated_connection():
+    """Отдельное соединение мимо пула для долгих потоковых операций (импорт, выгрузка).
+
+    Такая операция держит соединение, пока файл разбирается или пишется в пуле потоков;
+    из пула это отняло бы соединение у обычных запросов на всё это время.
+    """
+    if _pool is None:
+        raise RuntimeError("Пул соединений не открыт: сначала вызовите init_db()")
+    db = await _connect(DB_PATH)
+    try:
+        yield db
+    finally:
+        await db.finish_pending()
+        if db.in_transaction:
+            await db.rollback()
+        await db.close()
+
+
+async def close_db():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+# === Нормализация для привязки аккаунтов ===
+
+def normalize_full_name(full_name: Optional[str]) -> Optional[str]:
+    """«Иванов  И.И.» и «иванов и. и.» дают один ключ: нижний регистр, ё→е, единые пробелы.
+
+    Строка без букв и цифр («   », «...») ключа не даёт.
+    """
+    if not full_name or not any(ch.isalnum() for ch in full_name):
+        return None
+    name = full_name.lower().replace("ё", "е").replace(".", ". ")
+    return " ".join(name.split()) or None
+
+
+def initials_key(name_key: Optional[str]) -> Optional[str]:
+    """Фамилия и первые буквы остальных слов: «иванов иван иванович» и «иванов и. и.» → «иванов и и»."""
+    words = name_key.replace(".", " ").split() if name_key else []
+    if not words:
+        return None
+    surname, *rest = words
+    return " ".join([surname] + [word[0] for word in rest])
+
+
+def names_compatible(first_key: str, second_key: str) -> bool:
+    """Одинаковая фамилия, а остальные слова совпадают или одно из них — инициал другого."""
+    first = first_key.replace(".", " ").split()
+    second = second_key.replace(".", " ").split()
+    if not first or len(first) != len(second) or first[0] != second[0]:
+        return False
+    return all(
+        a == b or (len(a) == 1 and b.startswith(a)) or (len(b) == 1 and a.startswith(b))
+        for a, b in zip(first[1:], second[1:])
+    )
+
+
+def _name_keys(full_name: Optional[str]):
+    name_key = normalize_full_name(full_name)
+    return name_key, initials_key(name_key)
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Последние 10 цифр номера: +7 999…, 8 (999) … и 999… совпадают."""
+    if not phone:
+        return None
+    digits = "".join(ch for ch in str(phone) if ch.isdigit())
+    return digits[-10:] or None
+
+
+async def _add_column_if_missing(db, table: str, column: str, declaration: str):
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = {row["name"] for row in await cursor.fetchall()}
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+# === Индексы и горячие запросы ===
+
+INDEXES = (
+    # Частичный индекс: в нём только незавершённые задачи, которые ещё надо напоминать
+    "CREATE INDEX IF NOT EXISTS idx_tasks_due_reminder ON tasks(next_reminder) WHERE status != 'готово'",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_end_date ON tasks(user_id, end_date)",
+    # Постраничный список задач: user_id = ? AND id > ? ORDER BY id без сортировки во временном B-дереве
+    "CREATE INDEX IF NOT EXISTS idx_tasks_user_id ON tasks(user_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_full_name ON users(full_name)",
+    "CREATE INDEX IF NOT EXISTS idx_users_name_key ON users(name_key)",
+    # Один непривязанный пользователь на ФИО; привязанные к Telegram тёзки допустимы — это разные люди
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_name_key_unlinked ON users(name_key) WHERE tg_user_id IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_users_initials_key ON users(initials_key)",
+    "CREATE INDEX IF NOT EXISTS idx_users_phone_key ON users(phone_key)",
+    "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON reminder_outbox(id) WHERE state = 'pending'",
+    "CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_at)",
+)
+
+# Слот (task_id, next_reminder), уже поставленный в reminder_outbox, второй раз не выбирается
+DUE_REMINDERS_QUERY = """
+    SELECT t.id, t.description, t.end_date, t.status, u.tg_user_id, t.next_reminder
+    FROM tasks t
+    JOIN users u ON t.user_id = u.id
+    WHERE t.next_reminder <= ? AND t.status != 'готово'
+      AND u.tg_user_id IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM reminder_outbox_items i WHERE i.task_id = t.id AND i.slot = t.next_reminder
+      )
+"""
+# Те же задачи, но сгруппированные по преподавателю: одна строка на tg_user_id
+DUE_DIGEST_QUERY = """
+    SELECT u.tg_user_id,
+           json_group_array(json_object(
+               'id', d.id, 'description', d.description, 'end_date', d.end_date, 'slot', d.next_reminder
+           )) AS tasks
+    FROM (
+        SELECT t.id, t.user_id, t.description, t.end_date, t.next_reminder
+        FROM tasks t
+        WHERE t.next_reminder <= ? AND t.status != 'готово'
+          AND NOT EXISTS (
+              SELECT 1 FROM reminder_outbox_items i WHERE i.task_id = t.id AND i.slot = t.next_reminder
+          )
+        ORDER BY t.end_date
+    ) d
+    JOIN users u ON d.user_id = u.id
+    WHERE u.tg_user_id IS NOT NULL
+    GROUP BY u.tg_user_id
+"""
+# Обход частичного индекса по возрастанию до первой задачи привязанного к Telegram пользователя.
+# Уже поставленный в очередь слот пропускается, как и в DUE_*_QUERY: иначе будильник крутился бы на нём
+NEXT_DUE_QUERY = """
+    SELECT t.next_reminder
+    FROM tasks t
+    JOIN users u ON t.user_id = u.id
+    WHERE t.status != 'готово' AND t.next_reminder > ? AND u.tg_user_id IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM reminder_outbox_items i WHERE i.task_id = t.id AND i.slot = t.next_reminder
+      )
+    ORDER BY t.next_reminder
+    LIMIT 1
+"""
+TASKS_BY_USER_QUERY = "SELECT * FROM tasks WHERE user_id = ?"
+# Keyset-пагинация: страница вперёд от последнего показанного id и назад от первого
+TASKS_PAGE_AFTER_QUERY = "SELECT * FROM tasks WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?"
+TASKS_PAGE_BEFORE_QUERY = "SELECT * FROM tasks WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?"
+USER_MATCH_COLUMNS = "id, full_name, tg_user_id, is_admin, name_key"
+# Привязанные к Telegram — первыми: им реально дойдут задачи и напоминания
+USERS_BY_NAME_KEY_QUERY = f"SELECT {USER_MATCH_COLUMNS} FROM users WHERE name_key = ? ORDER BY tg_user_id IS NULL, id"
+USERS_BY_INITIALS_QUERY = f"SELECT {USER_MATCH_COLUMNS} FROM users WHERE initials_key = ? ORDER BY tg_user_id IS NULL, id"
+# Чем больше общих триграмм, тем выше bm25
+SIMILAR_USERS_QUERY = """
+    SELECT u.id, u.full_name, u.tg_user_id, u.is_admin, u.name_key
+    FROM (SELECT rowid, rank FROM users_fts WHERE users_fts MATCH ? ORDER BY rank LIMIT ?) hits
+    JOIN users u ON u.id = hits.rowid
+    ORDER BY hits.rank
+"""
+TASK_EXISTS_QUERY = """
+    SELECT 1 FROM tasks 
+    WHERE user_id = ? AND end_date = ? AND practice_name = ? AND description = ?
+"""
+TASK_EXISTS_NULL_PRACTICE_QUERY = """
+    SELECT 1 FROM tasks 
+    WHERE user_id = ? AND end_date = ? AND practice_name IS NULL AND description = ?
+"""
+USER_TASKS_QUERY = """
+    SELECT t.id, t.practice_name, t.description, t.end_date, t.status, t.next_reminder
+    FROM tasks t
+    WHERE t.user_id = ?
+"""
+# Сначала страница rowid из самого FTS-индекса (ORDER BY rank там дешевле всего), потом join только к ней
+SEARCH_TASKS_QUERY = """
+    SELECT t.id, t.practice_name, t.description, t.end_date, t.status, u.full_name
+    FROM (
+        SELECT rowid, rank FROM tasks_fts WHERE tasks_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+    ) hits
+    JOIN tasks t ON t.id = hits.rowid
+    JOIN users u ON u.id = t.user_id
+    ORDER BY hits.rank
+"""
+
+# Запросы, которые не должны скатываться в полный проход по таблице
+HOT_QUERIES = {
+    "due_reminders": (DUE_REMINDERS_QUERY, ("2025-01-01 09:00:00",)),
+    "due_digest": (DUE_DIGEST_QUERY, ("2025-01-01 09:00:00",)),
+    "next_due": (NEXT_DUE_QUERY, ("",)),
+    "tasks_by_user": (TASKS_BY_USER_QUERY, (1,)),
+    "tasks_page_after": (TASKS_PAGE_AFTER_QUERY, (1, 0, 5)),
+    "tasks_page_before": (TASKS_PAGE_BEFORE_QUERY, (1, 100, 5)),
+    "users_by_name_key": (USERS_BY_NAME_KEY_QUERY, ("иванов и. и.",)),
+    "users_by_initials": (USERS_BY_INITIALS_QUERY, ("иванов и и",)),
+    "similar_users": (SIMILAR_USERS_QUERY, ('"ива"', 5)),
+    "task_exists": (TASK_EXISTS_QUERY, (1, "2025-01-01", "", "")),
+    "task_exists_null_practice": (TASK_EXISTS_NULL_PRACTICE_QUERY, (1, "2025-01-01", "")),
+    "user_tasks": (USER_TASKS_QUERY, (1,)),
+    "search_tasks": (SEARCH_TASKS_QUERY, ('"практика"*', 10, 0)),
+}
+
+
+async def check_query_plans() -> Dict[str, List[str]]:
+    """Прогоняет EXPLAIN QUERY PLAN по горячим запросам.
+
+    Возвращает {имя запроса: шаги плана} для тех, где встречается полный SCAN таблицы.
+    """
+    regressions = {}
+    async with connection() as db:
+        for name, (query, params) in HOT_QUERIES.items():
+            async with db.execute("EXPLAIN QUERY PLAN " + query, params) as cursor:
+                steps = [row["detail"] for row in await cursor.fetchall()]
+            # SCAN по материализованному подзапросу — не проход по таблице, как и MATCH по FTS5 (VIRTUAL TABLE)
+            subqueries = {step.split()[1] for step in steps if step.startswith(("MATERIALIZE", "CO-ROUTINE"))}
+            if any(
+                step.startswith("SCAN") and step.split()[1] not in subqueries and "VIRTUAL TABLE" not in step
+                for step in steps
+            ):
+                regressions[name] = steps
+    return regressions
+
+
+# === Полнотекстовый поиск по задачам ===
+
+# External-content FTS5: индекс хранит только токены, тексты берутся из tasks по rowid
+TASK_SEARCH_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, practice_name, description)
+        VALUES (new.id, new.practice_name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, practice_name, description)
+        VALUES ('delete', old.id, old.practice_name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF practice_name, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, practice_name, description)
+        VALUES ('delete', old.id, old.practice_name, old.description);
+        INSERT INTO tasks_fts(rowid, practice_name, description)
+        VALUES (new.id, new.practice_name, new.description);
+    END""",
+)
+
+
+async def _create_task_search(db):
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'") as cursor:
+        exists = await cursor.fetchone() is not None
+    await db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            practice_name, description,
+            content='tasks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+    for trigger in TASK_SEARCH_TRIGGERS:
+        await db.execute(trigger)
+    if not exists:
+        # rank = bm25 с весами колонок: совпадение в названии практики весит вдвое больше, чем в описании
+        await db.execute("INSERT INTO tasks_fts(tasks_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
+        # Индекс появился на уже заполненной базе — строим его по существующим задачам
+        await db.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """Превращает ввод админа в запрос FTS5: каждое слово — префикс, все слова обязательны.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 (OR, NEAR, *, :) в тексте не исполняются.
+    """
+    words = "".join(ch if ch.isalnum() else " " for ch in text).split()
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+@timed_db
+async def search_tasks(text: str, limit: int = 10, offset: int = 0):
+    """Задачи, подходящие под запрос, от самых релевантных; пагинация через limit/offset."""
+    match = build_match_query(text)
+    if match is None:
+        return []
+    async with connection() as db:
+        async with db.execute(SEARCH_TASKS_QUERY, (match, limit, offset)) as cursor:
+            return await cursor.fetchall()
+
+
+# === Поиск преподавателей по ФИО ===
+
+USER_SEARCH_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, name_key) VALUES (new.id, new.name_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name_key) VALUES ('delete', old.id, old.name_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name_key ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name_key) VALUES ('delete', old.id, old.name_key);
+        INSERT INTO users_fts(rowid, name_key) VALUES (new.id, new.name_key);
+    END""",
+)
+
+
+async def _create_user_search(db):
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'") as cursor:
+        exists = await cursor.fetchone() is not None
+    await db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            name_key, content='users', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    for trigger in USER_SEARCH_TRIGGERS:
+        await db.execute(trigger)
+    if not exists:
+        await db.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+async def _merge_duplicate_users(db):
+    """Сливает непривязанных пользователей с одинаковым ключом ФИО в одну запись.
+
+    Задачи переезжают к основной записи (привязанной к Telegram, если такая есть), дубли удаляются.
+    """
+    await db.execute("""
+        CREATE TEMP TABLE user_merge AS
+        SELECT u.id AS old_id,
+               (SELECT c.id FROM users c WHERE c.name_key = u.name_key
+                ORDER BY c.tg_user_id IS NULL, c.id LIMIT 1) AS new_id
+        FROM users u
+        WHERE u.tg_user_id IS NULL AND u.name_key IS NOT NULL
+    """)
+    try:
+        await db.execute("DELETE FROM temp.user_merge WHERE old_id = new_id")
+        async with db.execute("SELECT COUNT(*) FROM temp.user_merge") as cursor:
+            merged = (await cursor.fetchone())[0]
+        if not merged:
+            return
+        await db.execute("""
+            UPDATE users SET
+                tg_username = COALESCE(tg_username, (
+                    SELECT MAX(d.tg_username) FROM temp.user_merge m JOIN users d ON d.id = m.old_id
+                    WHERE m.new_id = users.id)),
+                phone = COALESCE(phone, (
+                    SELECT MAX(d.phone) FROM temp.user_merge m JOIN users d ON d.id = m.old_id
+                    WHERE m.new_id = users.id)),
+                phone_key = COALESCE(phone_key, (
+                    SELECT MAX(d.phone_key) FROM temp.user_merge m JOIN users d ON d.id = m.old_id
+                    WHERE m.new_id = users.id))
+            WHERE id IN (SELECT new_id FROM temp.user_merge)
+        """)
+        # Задачи переносятся до удаления: иначе ON DELETE CASCADE удалит их вместе с дублем
+        await db.execute("""
+            UPDATE tasks SET user_id = (SELECT new_id FROM temp.user_merge WHERE old_id = tasks.user_id)
+            WHERE user_id IN (SELECT old_id FROM temp.user_merge)
+        """)
+        await db.execute("DELETE FROM users WHERE id IN (SELECT old_id FROM temp.user_merge)")
+        print(f"👥 Объединено дублей пользователей по ФИО: {merged}")
+    finally:
+        await db.execute("DROP TABLE temp.user_merge")
+
+
+async def _find_users(db, full_name: str) -> list:
+    """Пользователи с тем же ключом ФИО, а если таких нет — единственный совместимый по инициалам.
+
+    «Иванов И.И.» находит «Иванов Иван Иванович», но не при двух Ивановых И.И. — тогда ничего.
+    """
+    name_key, initials = _name_keys(full_name)
+    if not name_key:
+        return []
+    async with db.execute(USERS_BY_NAME_KEY_QUERY, (name_key,)) as cursor:
+        rows = await cursor.fetchall()
+    if rows:
+        return rows
+    async with db.execute(USERS_BY_INITIALS_QUERY, (initials,)) as cursor:
+        candidates = [row for row in await cursor.fetchall() if names_compatible(name_key, row["name_key"])]
+    return candidates if len(candidates) == 1 else []
+
+
+def _trigram_query(name_key: str) -> Optional[str]:
+    trigrams = {word[i:i + 3] for word in name_key.replace(".", " ").split() for i in range(len(word) - 2)}
+    if not trigrams:
+        return None
+    return " OR ".join(f'"{trigram}"' for trigram in sorted(trigrams))
+
+
+@timed_db
+async def suggest_users(full_name: str, limit: int = 5):
+    """Ближайшие по написанию пользователи: сначала совпавшие по инициалам, затем по общим триграммам."""
+    name_key, initials = _name_keys(full_name)
+    if not name_key:
+        return []
+    async with connection() as db:
+        async with db.execute(USERS_BY_INITIALS_QUERY, (initials,)) as cursor:
+            suggestions = list(await cursor.fetchall())
+        match = _trigram_query(name_key)
+        if match is not None:
+            seen = {row["id"] for row in suggestions}
+            async with db.execute(SIMILAR_USERS_QUERY, (match, limit)) as cursor:
+                suggestions += [row for row in await cursor.fetchall() if row["id"] not in seen]
+    return suggestions[:limit]
+
+
+async def open_db():
+    """Открывает пул соединений без миграций — для процессов-воркеров, когда схему уже создал init_db."""
+    global _pool
+    if _pool is None:
+        pool = ConnectionPool(DB_PATH, _pool_size, _pool_timeout)
+        await pool.open()
+        _pool = pool
+
 
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    await open_db()
+    async with connection() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -14,9 +518,16 @@ async def init_db():
                 full_name TEXT NOT NULL,
                 tg_username TEXT,
                 phone TEXT,
-                is_admin BOOLEAN DEFAULT 0
+                is_admin BOOLEAN DEFAULT 0,
+                name_key TEXT,
+                phone_key TEXT,
+                initials_key TEXT
             )
         """)
+        # Базы, созданные до появления ключей привязки, дополняем на месте
+        await _add_column_if_missing(db, "users", "name_key", "TEXT")
+        await _add_column_if_missing(db, "users", "phone_key", "TEXT")
+        await _add_column_if_missing(db, "users", "initials_key", "TEXT")
         await db.execute("""
             CREATE TABLE IF NOT EXISTS tasks (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -32,170 +543,563 @@ async def init_db():
                 FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
             )
         """)
+        # Очередь напоминаний: сообщение сначала записывается сюда, потом отправляется
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS reminder_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER,
+                text TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending' CHECK(state IN ('pending', 'sending', 'sent', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Ключ идемпотентности: одна задача в одном слоте напоминания попадает в очередь один раз
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS reminder_outbox_items (
+                task_id INTEGER NOT NULL,
+                slot DATETIME NOT NULL,
+                outbox_id INTEGER NOT NULL,
+                PRIMARY KEY (task_id, slot),
+                FOREIGN KEY(task_id) REFERENCES tasks(id) ON DELETE CASCADE,
+                FOREIGN KEY(outbox_id) REFERENCES reminder_outbox(id) ON DELETE CASCADE
+            )
+        """)
+        # Состояния FSM: диалоги админки переживают перезапуск бота
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_state (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            )
+        """)
+        await _create_task_search(db)
         await db.execute(
             "INSERT OR IGNORE INTO users (tg_user_id, full_name, is_admin) VALUES (?, ?, ?)",
             (5016152706, "Администратор", 1)
         )
+        async with db.execute(
+            "SELECT id, full_name, phone FROM users WHERE name_key IS NULL OR initials_key IS NULL"
+        ) as cursor:
+            stale = await cursor.fetchall()
+        await db.executemany(
+            "UPDATE users SET name_key = ?, initials_key = ?, phone_key = ? WHERE id = ?",
+            [(*_name_keys(row["full_name"]), normalize_phone(row["phone"]), row["id"]) for row in stale]
+        )
+        # Уникальный индекс по ключу ФИО появится только после слияния уже накопленных дублей
+        await _merge_duplicate_users(db)
+        for index in INDEXES:
+            await db.execute(index)
+        await _create_user_search(db)
         await db.commit()
+    for name, steps in (await check_query_plans()).items():
+        print(f"⚠️ Запрос {name} выполняется полным проходом по таблице: {'; '.join(steps)}")
+
+# === Подписка на новые напоминания ===
+
+_reminder_listeners: List[Callable[[str], None]] = []
+# Слушатели изменений пользователей: в многопроцессном режиме через них сбрасываются кэши соседей
+_user_listeners: List[Callable[[Optional[int]], None]] = []
+
+
+def on_reminder_scheduled(callback: Callable[[str], None]):
+    """Регистрирует callback, который получает next_reminder при каждой записи напоминания."""
+    _reminder_listeners.append(callback)
+
+
+def on_user_changed(callback: Callable[[Optional[int]], None]):
+    """Регистрирует callback, который получает tg id изменённого пользователя (None — изменились все)."""
+    _user_listeners.append(callback)
+
+
+def forget_cached_user(tg_id: Optional[int]):
+    """Сбрасывает кэш пользователя (None — весь кэш), не оповещая слушателей."""
+    if tg_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.invalidate(tg_id)
+
+
+def _invalidate_user(tg_id: Optional[int]):
+    forget_cached_user(tg_id)
+    for callback in _user_listeners:
+        callback(tg_id)
+
+
+def _notify_reminder(reminder_dt: Optional[str]):
+    if not reminder_dt:
+        return
+    for callback in _reminder_listeners:
+        callback(reminder_dt)
 
 # === Новые функции для админки ===
 
+@timed_db
 async def get_or_create_user_by_full_name(full_name: str, tg_username: str = None, phone: str = None) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT id FROM users WHERE full_name = ?", (full_name,)) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return row["id"]
+    async with connection() as db:
+        # По ключу и инициалам, а не по точному ФИО: «Иванов  И.И.» не должен завести второго Иванова
+        users = await _find_users(db, full_name)
+        if users:
+            return users[0]["id"]
+        if normalize_full_name(full_name) is None:
+            # Без букв и цифр нет ключа, и каждая такая строка завела бы нового пользователя
+            return None
+        # OR IGNORE: параллельный импорт мог только что создать того же пользователя
         await db.execute(
-            "INSERT INTO users (full_name, tg_username, phone) VALUES (?, ?, ?)",
-            (full_name, tg_username, phone)
+            "INSERT OR IGNORE INTO users (full_name, tg_username, phone, name_key, initials_key, phone_key) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (full_name, tg_username, phone, *_name_keys(full_name), normalize_phone(phone))
         )
         await db.commit()
-        async with db.execute("SELECT id FROM users WHERE full_name = ?", (full_name,)) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else None
+        users = await _find_users(db, full_name)
+        return users[0]["id"] if users else None
 
+@timed_db
 async def get_user_tasks_by_full_name(full_name: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("""
-            SELECT t.id, t.practice_name, t.description, t.end_date, t.status, t.next_reminder
-            FROM tasks t
-            JOIN users u ON t.user_id = u.id
-            WHERE u.full_name = ?
-        """, (full_name,)) as cursor:
-            return await cursor.fetchall()
+    tasks = []
+    async with connection() as db:
+        for user in await _find_users(db, full_name):
+            async with db.execute(USER_TASKS_QUERY, (user["id"],)) as cursor:
+                tasks.extend(await cursor.fetchall())
+    return tasks
 
+@timed_db
 async def update_task_reminder(task_id: int, reminder_dt: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         await db.execute(
             "UPDATE tasks SET next_reminder = ? WHERE id = ?",
             (reminder_dt, task_id)
         )
+        # Админ заново назначил уже отработавший слот — он хочет ещё одно напоминание.
+        # Ключ ещё не доставленного сообщения не трогаем, чтобы не отправить его дважды
+        await db.execute(
+            """
+            DELETE FROM reminder_outbox_items
+            WHERE task_id = ? AND slot = ?
+              AND outbox_id IN (SELECT id FROM reminder_outbox WHERE state IN ('sent', 'failed'))
+            """,
+            (task_id, reminder_dt)
+        )
         await db.commit()
+    _notify_reminder(reminder_dt)
 
+@timed_db
+async def get_next_due_reminder(after: Optional[str] = None) -> Optional[str]:
+    """Ближайший next_reminder незавершённых задач (строго позже after, если он задан)."""
+    async with connection() as db:
+        async with db.execute(NEXT_DUE_QUERY, (after or "",)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+@timed_db
 async def task_exists(user_id: int, practice_name: str, description: str, end_date: str) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         if practice_name is not None:
-            query = """
-                SELECT 1 FROM tasks 
-                WHERE user_id = ? AND end_date = ? AND practice_name = ? AND description = ?
-            """
+            query = TASK_EXISTS_QUERY
             params = (user_id, end_date, practice_name, description)
         else:
-            query = """
-                SELECT 1 FROM tasks 
-                WHERE user_id = ? AND end_date = ? AND practice_name IS NULL AND description = ?
-            """
+            query = TASK_EXISTS_NULL_PRACTICE_QUERY
             params = (user_id, end_date, description)
         async with db.execute(query, params) as cursor:
             return await cursor.fetchone() is not None
 
-async def add_tasks_from_excel(tasks: List[dict]) -> int:
-    from datetime import datetime, timedelta
-    count = 0
-    for task in tasks:
-        user_id = await get_or_create_user_by_full_name(
-            task["full_name"],
-            task.get("tg_username"),
-            task.get("phone")
+# SQLite ограничивает число параметров в одном запросе
+IMPORT_CHUNK_SIZE = 500
+
+
+async def _resolve_user_ids(db, contacts: Dict[str, tuple]) -> Dict[str, int]:
+    """Карта {ФИО из файла: id пользователя}; недостающие создаются одним executemany.
+
+    contacts — {ФИО: (tg_username, phone)} по первой строке файла с этим ФИО.
+    Сопоставление идёт по ключу ФИО (регистр, пробелы, ё), затем по совместимым инициалам,
+    так что «Иванов И.И.» и «иванов  и. и.» из одного файла не заводят двух пользователей.
+    """
+    if not contacts:
+        return {}
+    keys = {name: normalize_full_name(name) for name in contacts}
+    by_key: Dict[str, int] = {}
+
+    async def lookup(chunk):
+        placeholders = ", ".join("?" * len(chunk))
+        async with db.execute(
+            f"SELECT name_key, id FROM users WHERE name_key IN ({placeholders}) ORDER BY tg_user_id IS NULL, id",
+            chunk
+        ) as cursor:
+            for row in await cursor.fetchall():
+                by_key.setdefault(row["name_key"], row["id"])
+
+    distinct = list(dict.fromkeys(keys.values()))
+    for i in range(0, len(distinct), IMPORT_CHUNK_SIZE):
+        await lookup(distinct[i:i + IMPORT_CHUNK_SIZE])
+
+    # Новые для базы ключи: сначала ищем по инициалам (как _find_users, но пачками), только потом создаём
+    by_initials: Dict[str, list] = {}
+    initials = list(dict.fromkeys(
+        initials_key(key) for key in keys.values() if key not in by_key
+    ))
+    for i in range(0, len(initials), IMPORT_CHUNK_SIZE):
+        chunk = initials[i:i + IMPORT_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        async with db.execute(
+            f"SELECT {USER_MATCH_COLUMNS}, initials_key FROM users WHERE initials_key IN ({placeholders}) "
+            "ORDER BY tg_user_id IS NULL, id",
+            chunk
+        ) as cursor:
+            for row in await cursor.fetchall():
+                by_initials.setdefault(row["initials_key"], []).append(row)
+
+    new_names = {}
+    # Совместимые ФИО всегда с одним ключом инициалов: сравниваем только внутри группы
+    new_by_initials: Dict[str, List[str]] = {}
+    aliases = {}
+    for name, key in keys.items():
+        if key in by_key or key in new_names or key in aliases:
+            continue
+        # Как в _find_users: по инициалам берём только единственного совместимого
+        users = [user for user in by_initials.get(initials_key(key), []) if names_compatible(key, user["name_key"])]
+        if len(users) == 1:
+            by_key[key] = users[0]["id"]
+            continue
+        # «Иванов И.И.» рядом с «Иванов Иван Иванович» в том же файле — один человек
+        group = new_by_initials.setdefault(initials_key(key), [])
+        pending = [other for other in group if names_compatible(key, other)]
+        if len(pending) == 1:
+            aliases[key] = pending[0]
+        else:
+            new_names[key] = name
+            group.append(key)
+    if new_names:
+        await db.executemany(
+            "INSERT OR IGNORE INTO users (full_name, tg_username, phone, name_key, initials_key, phone_key) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (name, contacts[name][0], contacts[name][1], *_name_keys(name), normalize_phone(contacts[name][1]))
+                for name in new_names.values()
+            ]
         )
-        if not user_id:
+        missing = list(new_names)
+        for i in range(0, len(missing), IMPORT_CHUNK_SIZE):
+            await lookup(missing[i:i + IMPORT_CHUNK_SIZE])
+
+    by_key.update({key: by_key[target] for key, target in aliases.items() if target in by_key})
+    return {name: by_key[key] for name, key in keys.items() if key in by_key}
+
+
+def _staged_rows(tasks: List[dict], first_pos: int, contacts: Dict[str, tuple]) -> List[tuple]:
+    """Строки temp.import_rows для пачки; заодно запоминает контакты первого появления каждого ФИО.
+
+    Строки, ФИО которых не даёт ключа (одни пробелы или точки), пропускаются: привязать их не к кому.
+    """
+    from datetime import datetime, timedelta
+    rows = []
+    for pos, task in enumerate(tasks, first_pos):
+        if normalize_full_name(task["full_name"]) is None:
             continue
-        exists = await task_exists(
-            user_id,
+        contacts.setdefault(task["full_name"], (task.get("tg_username"), task.get("phone")))
+        first_reminder = datetime.strptime(task["end_date"], "%Y-%m-%d") - timedelta(days=7)
+        rows.append((
+            pos,
+            task["full_name"],
             task.get("practice_name"),
             task["description"],
-            task["end_date"]
-        )
-        if exists:
-            continue
-        end_dt = datetime.strptime(task["end_date"], "%Y-%m-%d")
-        first_reminder = end_dt - timedelta(days=7)
-        next_reminder = first_reminder.strftime("%Y-%m-%d 09:00:00")
-        await create_task(
-            practice_name=task.get("practice_name"),
-            start_date=task.get("start_date"),
-            end_date=task["end_date"],
-            user_id=user_id,
-            description=task["description"],
-            status="ещё не смотрел",
-            next_reminder=next_reminder
-        )
-        count += 1
-    return count
+            task.get("start_date"),
+            task["end_date"],
+            first_reminder.strftime("%Y-%m-%d 09:00:00"),
+        ))
+    return rows
+
+
+# Первое вхождение каждой задачи файла, которой ещё нет в tasks (practice_name сравнивается через IS)
+IMPORT_INSERT_QUERY = """
+    INSERT INTO tasks (practice_name, start_date, end_date, user_id, description, status, next_reminder)
+    SELECT practice_name, start_date, end_date, user_id, description, 'ещё не смотрел', next_reminder
+    FROM (
+        SELECT r.pos, r.practice_name, r.description, r.start_date, r.end_date, r.next_reminder, u.user_id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY u.user_id, r.practice_name, r.description, r.end_date ORDER BY r.pos
+               ) AS occurrence
+        FROM temp.import_rows r
+        JOIN temp.import_users u ON u.full_name = r.full_name
+    ) s
+    WHERE s.occurrence = 1 AND NOT EXISTS (
+        SELECT 1 FROM tasks t
+        WHERE t.user_id = s.user_id AND t.end_date = s.end_date
+          AND t.practice_name IS s.practice_name AND t.description = s.description
+    )
+    ORDER BY s.pos
+"""
+
+
+async def _iterate(items):
+    """Единый async-обход для обычных и асинхронных итераторов."""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+@timed_db
+async def add_tasks_from_excel(chunks: Union[Iterable[List[dict]], AsyncIterable[List[dict]]]) -> int:
+    """Массовый импорт пачек из utils.excel.iter_excel_chunks одной транзакцией.
+
+    Пока файл разбирается, пачки складываются во временную таблицу соединения: это не
+    блокирует запись в tasks.db другим (хранилище FSM, статусы задач). Блокировка на запись
+    берётся только на сопоставление пользователей и одну вставку INSERT ... SELECT.
+    Возвращает число добавленных задач.
+    """
+    async with dedicated_connection() as db:
+        await db.execute("""
+            CREATE TEMP TABLE import_rows (
+                pos INTEGER PRIMARY KEY,
+                full_name TEXT,
+                practice_name TEXT,
+                description TEXT,
+                start_date TEXT,
+                end_date DATE,
+                next_reminder DATETIME
+            )
+        """)
+        await db.execute("CREATE TEMP TABLE import_users (full_name TEXT PRIMARY KEY, user_id INTEGER)")
+        try:
+            contacts = {}
+            staged = 0
+            async for chunk in _iterate(chunks):
+                if not chunk:
+                    continue
+                await db.executemany(
+                    "INSERT INTO temp.import_rows VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    _staged_rows(chunk, staged, contacts)
+                )
+                staged += len(chunk)
+            # Запись шла только во временную базу; закрываем её транзакцию перед BEGIN IMMEDIATE
+            await db.commit()
+
+            await db.execute("BEGIN IMMEDIATE")
+            user_ids = await _resolve_user_ids(db, contacts)
+            await db.executemany("INSERT INTO temp.import_users VALUES (?, ?)", user_ids.items())
+            async with db.execute("SELECT COALESCE(MAX(id), 0) FROM tasks") as cursor:
+                last_id = (await cursor.fetchone())[0]
+            await db.execute(IMPORT_INSERT_QUERY)
+            async with db.execute(
+                "SELECT COUNT(*), MIN(next_reminder) FROM tasks WHERE id > ?", (last_id,)
+            ) as cursor:
+                added, earliest_reminder = await cursor.fetchone()
+            await db.commit()
+        finally:
+            # При ошибке откатываем и созданных пользователей, и задачи: файл импортируется целиком или никак
+            if db.in_transaction:
+                await db.rollback()
+            await db.execute("DROP TABLE temp.import_rows")
+            await db.execute("DROP TABLE temp.import_users")
+    _notify_reminder(earliest_reminder)
+    return added
 
 # === Остальные функции ===
 
+@timed_db
 async def wipe_tasks():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         await db.execute("DELETE FROM tasks")
         await db.commit()
 
+@timed_db
 async def wipe_users_except_admin():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         await db.execute("DELETE FROM users WHERE tg_user_id != ?", (5016152706,))
         await db.commit()
+    _invalidate_user(None)
 
+@timed_db
 async def get_user_by_full_name(full_name: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT id, tg_user_id, is_admin FROM users WHERE full_name = ?", (full_name,)) as cursor:
-            return await cursor.fetchall()
+    """Пользователи с этим ФИО (с точностью до регистра, пробелов и инициалов)."""
+    async with connection() as db:
+        return await _find_users(db, full_name)
 
+@timed_db
 async def set_user_admin(tg_user_id: int, is_admin: bool):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         await db.execute("UPDATE users SET is_admin = ? WHERE tg_user_id = ?", (1 if is_admin else 0, tg_user_id))
         await db.commit()
+    _invalidate_user(tg_user_id)
+
+EXPORT_TASKS_QUERY = """
+    SELECT 
+        t.practice_name,
+        t.start_date,
+        t.end_date,
+        u.full_name,
+        u.tg_username,
+        u.phone,
+        t.description AS task_description,
+        t.status,
+        t.next_reminder
+    FROM tasks t
+    JOIN users u ON t.user_id = u.id
+"""
+EXPORT_BATCH_SIZE = 500
 
+@timed_db
 async def get_all_tasks_for_export():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("""
-            SELECT 
-                t.practice_name,
-                t.start_date,
-                t.end_date,
-                u.full_name,
-                u.tg_username,
-                u.phone,
-                t.description AS task_description,
-                t.status,
-                t.next_reminder
-            FROM tasks t
-            JOIN users u ON t.user_id = u.id
-        """) as cursor:
+    async with connection() as db:
+        async with db.execute(EXPORT_TASKS_QUERY) as cursor:
             return await cursor.fetchall()
 
+@timed_db
+async def iter_tasks_for_export(batch_size: int = EXPORT_BATCH_SIZE):
+    """Отдаёт строки выгрузки пачками прямо из курсора, не материализуя всю таблицу."""
+    async with dedicated_connection() as db:
+        async with db.execute(EXPORT_TASKS_QUERY) as cursor:
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+
+@timed_db
 async def get_tasks_by_user_id(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM tasks WHERE user_id = ?", (user_id,)) as cursor:
+    async with connection() as db:
+        async with db.execute(TASKS_BY_USER_QUERY, (user_id,)) as cursor:
             return await cursor.fetchall()
 
+@timed_db
+async def get_tasks_page(user_id: int, after_id: int = 0, before_id: int = None, limit: int = 5):
+    """Страница задач пользователя по id: после after_id или (если задан) перед before_id.
+
+    Возвращает (задачи по возрастанию id, есть ли страница раньше, есть ли страница дальше).
+    Лишняя строка в LIMIT показывает, есть ли что-то за краем страницы, без COUNT(*).
+    """
+    async with connection() as db:
+        if before_id is not None:
+            async with db.execute(TASKS_PAGE_BEFORE_QUERY, (user_id, before_id, limit + 1)) as cursor:
+                rows = await cursor.fetchall()
+            has_prev = len(rows) > limit
+            return list(reversed(rows[:limit])), has_prev, True
+        async with db.execute(TASKS_PAGE_AFTER_QUERY, (user_id, after_id, limit + 1)) as cursor:
+            rows = await cursor.fetchall()
+        has_prev = False
+        if after_id > 0:
+            async with db.execute(TASKS_PAGE_BEFORE_QUERY, (user_id, after_id + 1, 1)) as cursor:
+                has_prev = await cursor.fetchone() is not None
+        return rows[:limit], has_prev, len(rows) > limit
+
+@timed_db
+async def set_task_status(task_id: int, user_id: int, status: str) -> bool:
+    """Меняет статус задачи одним UPDATE, только если она принадлежит user_id.
+
+    Возвращает False, если задача чужая, не найдена или статус уже такой — тогда записи не было.
+    """
+    async with connection() as db:
+        async with db.execute(
+            "UPDATE tasks SET status = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE id = ? AND user_id = ? AND status IS NOT ? RETURNING next_reminder",
+            (status, task_id, user_id, status)
+        ) as cursor:
+            row = await cursor.fetchone()
+        await db.commit()
+    if row is None:
+        return False
+    # Задача, возвращённая из «готово», снова попадает в расписание напоминаний
+    if status != "готово":
+        _notify_reminder(row["next_reminder"])
+    return True
+
+@timed_db
 async def get_user_by_tg_id(tg_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    user = _user_cache.get(tg_id)
+    if user is not MISSING:
+        return user
+    generation = _user_cache.generation
+    async with connection() as db:
         async with db.execute("SELECT * FROM users WHERE tg_user_id = ?", (tg_id,)) as cursor:
-            return await cursor.fetchone()
+            user = await cursor.fetchone()
+    _user_cache.set(tg_id, user, generation)
+    return user
 
+@timed_db
 async def create_user(tg_id: int, full_name: str, username: str = None):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         await db.execute(
-            "INSERT INTO users (tg_user_id, full_name, tg_username) VALUES (?, ?, ?)",
-            (tg_id, full_name, username)
+            "INSERT INTO users (tg_user_id, full_name, tg_username, name_key, initials_key) VALUES (?, ?, ?, ?, ?)",
+            (tg_id, full_name, username, *_name_keys(full_name))
         )
         await db.commit()
+        _invalidate_user(tg_id)
         async with db.execute("SELECT id FROM users WHERE tg_user_id = ?", (tg_id,)) as cursor:
             row = await cursor.fetchone()
             return row[0] if row else None
 
+@timed_db
+async def register_user(tg_id: int, full_name: Optional[str], username: str = None, phone: str = None) -> int:
+    """Регистрация с привязкой: если админ уже завёл преподавателя (импорт/вручную),
+    Telegram-аккаунт привязывается к этой записи, а не создаёт вторую.
+
+    Совпадение ищется среди непривязанных пользователей по телефону, username и ФИО.
+    """
+    phone_key = normalize_phone(phone)
+    handles = []
+    if username:
+        handle = username.lstrip("@").lower()
+        handles = [handle, f"@{handle}"]
+    async with connection() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        async with db.execute("SELECT id FROM users WHERE tg_user_id = ?", (tg_id,)) as cursor:
+            row = await cursor.fetchone()
+        if row:
+            await db.commit()
+            return row["id"]
+
+        candidate = None
+        lookups = [
+            ("phone_key = ?", (phone_key,), phone_key),
+            ("lower(tg_username) IN (?, ?)", tuple(handles), handles),
+        ]
+        for condition, params, enabled in lookups:
+            if not enabled:
+                continue
+            async with db.execute(
+                f"SELECT id FROM users WHERE tg_user_id IS NULL AND {condition} ORDER BY id LIMIT 1", params
+            ) as cursor:
+                candidate = await cursor.fetchone()
+            if candidate:
+                break
+        if candidate is None and full_name:
+            # ФИО — с точностью до регистра, пробелов и инициалов
+            unlinked = [user for user in await _find_users(db, full_name) if user["tg_user_id"] is None]
+            candidate = unlinked[0] if unlinked else None
+
+        if candidate:
+            user_id = candidate["id"]
+            await db.execute(
+                "UPDATE users SET tg_user_id = ?, tg_username = COALESCE(?, tg_username), "
+                "phone = COALESCE(?, phone), phone_key = COALESCE(?, phone_key) WHERE id = ?",
+                (tg_id, username, phone, phone_key, user_id)
+            )
+        else:
+            if not full_name:
+                await db.commit()
+                return None
+            cursor = await db.execute(
+                "INSERT INTO users (tg_user_id, full_name, tg_username, phone, name_key, initials_key, phone_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (tg_id, full_name, username, phone, *_name_keys(full_name), phone_key)
+            )
+            user_id = cursor.lastrowid
+        await db.commit()
+    _invalidate_user(tg_id)
+    return user_id
+
+@timed_db
 async def create_task(**kwargs):
     if not kwargs:
         return
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         columns = ", ".join(kwargs.keys())
         placeholders = ", ".join("?" * len(kwargs))
         query = f"INSERT INTO tasks ({columns}) VALUES ({placeholders})"
         await db.execute(query, tuple(kwargs.values()))
-        await db.commit()
\ No newline at end of file
+        await db.commit()
+    _notify_reminder(kwargs.get("next_reminder"))
\ No newline at end of file
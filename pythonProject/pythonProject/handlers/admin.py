@@ -1,7 +1,9 @@
 # handlers/admin.py
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import (
+    CallbackQuery,
     Message,
     KeyboardButton,
     ReplyKeyboardMarkup,
@@ -16,30 +18,40 @@ from database import (
     set_user_admin,
     wipe_tasks,
     wipe_users_except_admin,
-    get_all_tasks_for_export,
+    iter_tasks_for_export,
     get_or_create_user_by_full_name,
     add_tasks_from_excel,
     create_task,
     get_user_tasks_by_full_name,
     update_task_reminder,
-    get_user_by_tg_id,
+    search_tasks,
+    suggest_users,
 )
 from utils.excel import (
-    export_tasks_to_excel,
-    parse_excel_from_bytes,
     create_excel_template,
     normalize_date,
 )
+from utils.formats import (
+    EXPORT_FORMATS,
+    IMPORT_SUFFIXES,
+    create_export_writer,
+    iter_task_chunks,
+)
+from utils.executor import run_blocking, iterate_blocking
+from utils.metrics import EXPORT_DURATION, EXPORT_ROWS, IMPORT_DURATION, IMPORT_ROWS
+from utils.querylog import QUERY_LOG
 import tempfile
 import os
+import time
+from html import escape
 from datetime import datetime, timedelta
 from io import BytesIO
 
 admin_router = Router()
 
 # === Функция проверки админа ===
-async def is_admin(tg_id: int) -> bool:
-    user = await get_user_by_tg_id(tg_id)
+def is_admin(user) -> bool:
+    # user подставляет UserMiddleware
     return bool(user and user["is_admin"])
 
 # === FSM ===
@@ -56,6 +68,9 @@ class WipeStates(StatesGroup):
     confirm_tasks = State()
     confirm_users = State()
 
+class SearchStates(StatesGroup):
+    waiting_for_query = State()
+
 class SetReminderStates(StatesGroup):
     waiting_for_full_name = State()
     waiting_for_task_choice = State()
@@ -63,14 +78,16 @@ class SetReminderStates(StatesGroup):
 
 # === Админ-панель ===
 @admin_router.message(F.text == "👨‍💼 Админ-панель")
-async def admin_panel(message: Message):
-    if not await is_admin(message.from_user.id):
+async def admin_panel(message: Message, user):
+    if not is_admin(user):
         return
     kb = [
         [KeyboardButton(text="📥 Выгрузить все задачи")],
         [KeyboardButton(text="📤 Загрузить Excel")],
         [KeyboardButton(text="➕ Добавить задачу вручную")],
         [KeyboardButton(text="⏰ Настроить напоминание")],
+        [KeyboardButton(text="🔎 Поиск задач")],
+        [KeyboardButton(text="🐢 Медленные запросы")],
         [KeyboardButton(text="👑 Назначить/удалить админа")],
         [KeyboardButton(text="🧹 Очистить БД")]
     ]
@@ -80,6 +97,8 @@ async def admin_panel(message: Message):
         "• 📤 Загрузить Excel\n"
         "• ➕ Добавить задачу вручную\n"
         "• ⏰ Настроить напоминание\n"
+        "• 🔎 Поиск задач (или /search текст)\n"
+        "• 🐢 Медленные запросы (или /slow)\n"
         "• 👑 Назначить/удалить админа\n"
         "• 🧹 Очистить БД",
         reply_markup=ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
@@ -87,8 +106,8 @@ async def admin_panel(message: Message):
 
 # === Добавление задачи вручную ===
 @admin_router.message(F.text == "➕ Добавить задачу вручную")
-async def start_add_task(message: Message, state: FSMContext):
-    if not await is_admin(message.from_user.id):
+async def start_add_task(message: Message, state: FSMContext, user):
+    if not is_admin(user):
         return
     await message.answer("🆕 Введите ФИО преподавателя:")
     await state.set_state(AddTaskManually.waiting_for_full_name)
@@ -96,7 +115,8 @@ async def start_add_task(message: Message, state: FSMContext):
 @admin_router.message(AddTaskManually.waiting_for_full_name)
 async def process_full_name_step(message: Message, state: FSMContext):
     full_name = message.text.strip()
-    if len(full_name.split()) < 2:
+    # Слова без букв («... ...») за фамилию и имя не считаются
+    if len([word for word in full_name.split() if any(ch.isalpha() for ch in word)]) < 2:
         await message.answer("❌ Введите полное ФИО (минимум имя и фамилия).")
         return
     await state.update_data(full_name=full_name)
@@ -143,67 +163,117 @@ async def process_end_date_step(message: Message, state: FSMContext):
 
 # === Загрузка Excel ===
 @admin_router.message(F.text == "📤 Загрузить Excel")
-async def request_excel_upload(message: Message):
-    if not await is_admin(message.from_user.id):
+async def request_excel_upload(message: Message, user):
+    if not is_admin(user):
         return
-    template_path = create_excel_template()
+    template_path = await run_blocking(create_excel_template)
     await message.answer_document(FSInputFile(template_path, filename="шаблон.xlsx"))
     os.unlink(template_path)
 
+async def _prepend(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
 @admin_router.message(F.document)
-async def handle_excel_upload(message: Message):
-    if not await is_admin(message.from_user.id):
+async def handle_excel_upload(message: Message, user):
+    if not is_admin(user):
         return
-    if not message.document.file_name.endswith('.xlsx'):
-        await message.answer("❌ Только .xlsx")
+    file_name = message.document.file_name or ""
+    if not file_name.lower().endswith(IMPORT_SUFFIXES):
+        await message.answer(f"❌ Поддерживаются только {', '.join(IMPORT_SUFFIXES)}")
         return
+    started = time.perf_counter()
     try:
         file = await message.bot.download(message.document.file_id)
         file_bytes = BytesIO(file.read())
-        tasks = parse_excel_from_bytes(file_bytes)
-        if not tasks:
+        # Разбор идёт в отдельном потоке, пачки приходят по мере готовности
+        chunks = iterate_blocking(iter_task_chunks(file_bytes, file_name))
+        first_chunk = await anext(chunks, None)
+        if not first_chunk:
             await message.answer("❌ Нет валидных задач.")
             return
-        added = await add_tasks_from_excel(tasks)
+        added = await add_tasks_from_excel(_prepend(first_chunk, chunks))
+        IMPORT_DURATION.observe(time.perf_counter() - started)
+        IMPORT_ROWS.inc(added)
         await message.answer(f"✅ Добавлено: {added}")
     except Exception as e:
         await message.answer(f"❌ Ошибка: {e}")
 
 # === Выгрузка задач ===
 @admin_router.message(F.text == "📥 Выгрузить все задачи")
-async def export_all_tasks(message: Message):
-    if not await is_admin(message.from_user.id):
+async def export_all_tasks(message: Message, user):
+    if not is_admin(user):
         return
-    tasks = await get_all_tasks_for_export()
-    if not tasks:
-        await message.answer("📭 Нет задач.")
+    await message.answer(
+        "📥 Выберите формат выгрузки:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=title, callback_data=f"export:{fmt}")]
+            for fmt, (title, _) in EXPORT_FORMATS.items()
+        ])
+    )
+
+@admin_router.callback_query(F.data.startswith("export:"))
+async def export_in_format(callback: CallbackQuery, user):
+    if not is_admin(user):
+        await callback.answer()
+        return
+    fmt = callback.data.split(":", 1)[1]
+    if fmt not in EXPORT_FORMATS:
+        await callback.answer("❌ Неизвестный формат")
         return
-    filepath = export_tasks_to_excel(tasks)
-    await message.answer_document(FSInputFile(filepath))
-    os.remove(filepath)
+    await callback.answer("⏳ Готовлю файл...")
+    # Строки идут из курсора пачками прямо в файл, таблица целиком в памяти не бывает
+    started = time.perf_counter()
+    writer = filepath = None
+    try:
+        writer = await run_blocking(create_export_writer, fmt)
+        async for batch in iter_tasks_for_export():
+            await run_blocking(writer.append, batch)
+        filepath = await run_blocking(writer.save)
+        EXPORT_DURATION.observe(time.perf_counter() - started, format=fmt)
+        EXPORT_ROWS.inc(writer.rows, format=fmt)
+        if not writer.rows:
+            await callback.message.answer("📭 Нет задач.")
+            return
+        await callback.message.answer_document(FSInputFile(filepath, filename=f"задачи.{writer.extension}"))
+    finally:
+        # Выгрузка упала на середине — недописанный файл не оставляем
+        if filepath is not None:
+            os.remove(filepath)
+        elif writer is not None:
+            writer.discard()
 
 # === Назначение админа ===
 @admin_router.message(F.text == "👑 Назначить/удалить админа")
-async def start_admin_manage(message: Message, state: FSMContext):
-    if not await is_admin(message.from_user.id):
+async def start_admin_manage(message: Message, state: FSMContext, user):
+    if not is_admin(user):
         return
     await message.answer("Введите ФИО пользователя:")
     await state.set_state(AdminManageStates.waiting_name)
 
+async def _not_found_text(text: str, full_name: str) -> str:
+    """Дополняет ответ «не найден» похожими ФИО: опечатки и инициалы вместо полного имени."""
+    similar = await suggest_users(full_name)
+    if not similar:
+        return text
+    names = "\n".join(f"• {u['full_name']}" for u in similar)
+    return f"{text}\n\nВозможно, вы имели в виду:\n{names}"
+
 @admin_router.message(AdminManageStates.waiting_name)
 async def handle_admin_name(message: Message, state: FSMContext):
     full_name = message.text.strip()
     users = await get_user_by_full_name(full_name)
     if not users:
-        await message.answer("❌ Пользователь не найден.")
+        await message.answer(await _not_found_text("❌ Пользователь не найден.", full_name))
         await state.clear()
         return
     if len(users) > 1:
-        details = "\n".join([f"• TG ID: {u[1]}, админ: {'да' if u[2] else 'нет'}" for u in users])
+        details = "\n".join([f"• TG ID: {u['tg_user_id']}, админ: {'да' if u['is_admin'] else 'нет'}" for u in users])
         await message.answer(f"⚠️ Найдено несколько:\n{details}\n\nУточните ФИО.")
         await state.clear()
         return
-    user_id, tg_id, is_adm = users[0]
+    tg_id, is_adm = users[0]["tg_user_id"], bool(users[0]["is_admin"])
     action = "удалить из админов" if is_adm else "назначить админом"
     await state.update_data(tg_id=tg_id, is_adm=is_adm, full_name=full_name)
     await message.answer(f"Подтвердите: {action}? (да/нет)")
@@ -224,8 +294,8 @@ async def confirm_admin_change(message: Message, state: FSMContext):
 
 # === Настройка напоминания ===
 @admin_router.message(F.text == "⏰ Настроить напоминание")
-async def start_set_reminder(message: Message, state: FSMContext):
-    if not await is_admin(message.from_user.id):
+async def start_set_reminder(message: Message, state: FSMContext, user):
+    if not is_admin(user):
         return
     await message.answer("⏰ Введите ФИО преподавателя:")
     await state.set_state(SetReminderStates.waiting_for_full_name)
@@ -235,10 +305,11 @@ async def process_reminder_full_name(message: Message, state: FSMContext):
     full_name = message.text.strip()
     tasks = await get_user_tasks_by_full_name(full_name)
     if not tasks:
-        await message.answer("❌ У преподавателя нет задач.")
+        await message.answer(await _not_found_text("❌ У преподавателя нет задач.", full_name))
         await state.clear()
         return
-    await state.update_data(full_name=full_name, tasks=tasks)
+    # В состоянии только id: строки БД не сериализуются и устаревают
+    await state.update_data(full_name=full_name, task_ids=[t["id"] for t in tasks])
     task_list = "\n".join([
         f"{i+1}. {(t['practice_name'] or t['description'])[:30]}... (до {t['end_date']})"
         for i, t in enumerate(tasks)
@@ -250,9 +321,10 @@ async def process_reminder_full_name(message: Message, state: FSMContext):
 async def process_task_choice(message: Message, state: FSMContext):
     try:
         idx = int(message.text.strip()) - 1
+        if idx < 0:
+            raise IndexError(idx)
         data = await state.get_data()
-        task = data["tasks"][idx]
-        await state.update_data(selected_task_id=task["id"])
+        await state.update_data(selected_task_id=data["task_ids"][idx])
         await message.answer(
             "🕒 Выберите напоминание:\n"
             "• 1 — через 1 день\n"
@@ -282,10 +354,122 @@ async def process_reminder_choice(message: Message, state: FSMContext):
     except ValueError:
         await message.answer("❌ Неверный формат. Используйте 1/3/7 или ДД.ММ.ГГГГ ЧЧ:ММ")
 
+# === Поиск задач ===
+SEARCH_PAGE_SIZE = 10
+
+def _render_search_page(query: str, rows, offset: int):
+    has_next = len(rows) > SEARCH_PAGE_SIZE
+    rows = rows[:SEARCH_PAGE_SIZE]
+    lines = [f"🔎 <b>{escape(query)}</b>"]
+    for number, task in enumerate(rows, start=offset + 1):
+        title = escape((task["practice_name"] or task["description"])[:60])
+        lines.append(
+            f"{number}. {title}\n"
+            f"    👤 {escape(task['full_name'])} · 📅 {task['end_date']} · 📝 {task['status']}"
+        )
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=f"search:{max(offset - SEARCH_PAGE_SIZE, 0)}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text="Дальше ➡️", callback_data=f"search:{offset + SEARCH_PAGE_SIZE}"))
+    markup = InlineKeyboardMarkup(inline_keyboard=[navigation]) if navigation else None
+    return "\n".join(lines), markup
+
+async def _answer_search(message: Message, state: FSMContext, query: str):
+    rows = await search_tasks(query, SEARCH_PAGE_SIZE + 1)
+    if not rows:
+        await message.answer("📭 Ничего не найдено.")
+        return
+    # Запрос нужен для листания: в callback_data он может не поместиться
+    await state.update_data(search_query=query)
+    text, markup = _render_search_page(query, rows, 0)
+    await message.answer(text, parse_mode="HTML", reply_markup=markup)
+
+@admin_router.message(Command("search"))
+async def search_command(message: Message, state: FSMContext, user):
+    if not is_admin(user):
+        return
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await message.answer("🔎 Использование: /search текст (название практики или описание)")
+        return
+    await _answer_search(message, state, query)
+
+@admin_router.message(F.text == "🔎 Поиск задач")
+async def start_search(message: Message, state: FSMContext, user):
+    if not is_admin(user):
+        return
+    await message.answer("🔎 Введите слова из названия практики или описания:")
+    await state.set_state(SearchStates.waiting_for_query)
+
+@admin_router.message(SearchStates.waiting_for_query)
+async def process_search_query(message: Message, state: FSMContext):
+    await state.set_state(None)
+    await _answer_search(message, state, (message.text or "").strip())
+
+@admin_router.callback_query(F.data.startswith("search:"))
+async def turn_search_page(callback: CallbackQuery, state: FSMContext, user):
+    if not is_admin(user):
+        await callback.answer()
+        return
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.answer("Повторите поиск")
+        return
+    offset = int(callback.data.split(":", 1)[1])
+    rows = await search_tasks(query, SEARCH_PAGE_SIZE + 1, offset)
+    if not rows:
+        await callback.answer("📭 Здесь результатов больше нет.")
+        return
+    text, markup = _render_search_page(query, rows, offset)
+    try:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await callback.answer()
+
+# === Медленные запросы ===
+SLOW_TOP_SIZE = 10
+SLOW_SQL_PREVIEW = 200
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def _render_slow_queries() -> str:
+    stats = QUERY_LOG.top(SLOW_TOP_SIZE)
+    if not stats:
+        return "📭 Запросов ещё не было."
+    threshold = f"{QUERY_LOG.threshold * 1000:.0f} мс" if QUERY_LOG.threshold is not None else "выключен"
+    text = f"🐢 <b>Самые тяжёлые запросы</b> (с запуска процесса, порог лога: {threshold})"
+    for i, item in enumerate(stats, 1):
+        sql = item.sql if len(item.sql) <= SLOW_SQL_PREVIEW else item.sql[:SLOW_SQL_PREVIEW] + "…"
+        entry = (
+            f"\n\n{i}. Σ {item.total * 1000:.0f} мс · вызовов {item.calls} · "
+            f"ср. {item.mean * 1000:.1f} мс · макс. {item.max * 1000:.1f} мс · строк {item.rows}"
+        )
+        if item.slow:
+            entry += f" · медленных {item.slow}"
+        entry += f"\n<code>{escape(sql)}</code>"
+        if item.plan:
+            entry += f"\n📐 {escape('; '.join(item.plan))}"
+        # Сообщение обрезаем по целым записям, а не посреди тега
+        if len(text) + len(entry) > TELEGRAM_MESSAGE_LIMIT:
+            break
+        text += entry
+    return text
+
+@admin_router.message(Command("slow"))
+@admin_router.message(F.text == "🐢 Медленные запросы")
+async def show_slow_queries(message: Message, user):
+    if not is_admin(user):
+        return
+    await message.answer(_render_slow_queries(), parse_mode="HTML")
+
 # === Очистка БД ===
 @admin_router.message(F.text == "🧹 Очистить БД")
-async def start_wipe(message: Message, state: FSMContext):
-    if not await is_admin(message.from_user.id):
+async def start_wipe(message: Message, state: FSMContext, user):
+    if not is_admin(user):
         return
     await message.answer("🧹 Удалить все задачи? (да/нет)")
     await state.set_state(WipeStates.confirm_tasks)
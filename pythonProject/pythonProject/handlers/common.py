@@ -1,19 +1,25 @@
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message
-from database import get_user_by_tg_id
+from aiogram.types import Message, KeyboardButton, ReplyKeyboardMarkup
 from handlers.user import show_user_menu
 
 common_router = Router()
 
 @common_router.message(F.text == "/start")
 @common_router.message(F.text == "/start")
-async def cmd_start(message: Message, state: FSMContext):
-    user = await get_user_by_tg_id(message.from_user.id)
+async def cmd_start(message: Message, state: FSMContext, user):
     if user:
-        await show_user_menu(message)
+        await show_user_menu(message, user)
     else:
-        await message.answer("👋 Добро пожаловать!\nПожалуйста, введите ваше ФИО:")
+        await message.answer(
+            "👋 Добро пожаловать!\nПожалуйста, введите ваше ФИО "
+            "или отправьте номер телефона, если администратор уже добавил вас:",
+            reply_markup=ReplyKeyboardMarkup(
+                keyboard=[[KeyboardButton(text="📱 Отправить номер телефона", request_contact=True)]],
+                resize_keyboard=True,
+                one_time_keyboard=True
+            )
+        )
         await message.answer("Пример: Иванов Иван Иванович")
         from handlers.user import RegisterStates
         await state.set_state(RegisterStates.waiting_for_name)
@@ -1,9 +1,21 @@
 # handlers/user.py
+import time
+from html import escape
+from typing import Dict, Optional, Tuple
+
 from aiogram import Router, F
-from aiogram.types import Message, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import (
+    CallbackQuery,
+    Message,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+    InlineKeyboardMarkup,
+    InlineKeyboardButton,
+)
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import get_user_by_tg_id, create_user, get_tasks_by_user_id
+from database import get_user_by_tg_id, register_user, get_tasks_page, set_task_status
 
 user_router = Router()
 
@@ -11,19 +23,37 @@ class RegisterStates(StatesGroup):
     waiting_for_name = State()
 
 # --- Регистрация ---
-@user_router.message(RegisterStates.waiting_for_name)
+@user_router.message(RegisterStates.waiting_for_name, F.contact)
+async def process_contact(message: Message, state: FSMContext):
+    # Чужой контакт не даёт права привязаться к чужой записи
+    if message.contact.user_id != message.from_user.id:
+        await message.answer("❌ Отправьте, пожалуйста, свой номер кнопкой ниже или введите ФИО.")
+        return
+    phone = message.contact.phone_number
+    user_id = await register_user(message.from_user.id, None, message.from_user.username, phone)
+    if user_id:
+        await state.clear()
+        await show_user_menu(message)
+        return
+    await state.update_data(phone=phone)
+    await message.answer("📱 Номер сохранён. Теперь введите ваше ФИО:")
+
+@user_router.message(RegisterStates.waiting_for_name, F.text)
 async def process_full_name(message: Message, state: FSMContext):
     full_name = message.text.strip()
-    if len(full_name.split()) < 2:
+    # Слова без букв («... ...») за фамилию и имя не считаются
+    if len([word for word in full_name.split() if any(ch.isalpha() for ch in word)]) < 2:
         await message.answer("❌ Пожалуйста, введите полное ФИО (минимум имя и фамилия).")
         return
-    await create_user(message.from_user.id, full_name, message.from_user.username)
+    data = await state.get_data()
+    await register_user(message.from_user.id, full_name, message.from_user.username, data.get("phone"))
     await state.clear()
     await show_user_menu(message)
 
 # --- Меню ---
-async def show_user_menu(message: Message):
-    user = await get_user_by_tg_id(message.from_user.id)
+async def show_user_menu(message: Message, user=None):
+    if user is None:
+        user = await get_user_by_tg_id(message.from_user.id)
     if not user:
         return
 
@@ -39,32 +69,153 @@ async def show_user_menu(message: Message):
     )
 
 # --- Задачи ---
+TASKS_PER_PAGE = 5
+# Длинные описания обрезаются, чтобы страница из пяти задач влезла в одно сообщение
+TASK_DESCRIPTION_LIMIT = 300
+# Заголовок — название практики, а без него (краткий формат импорта) — то же описание
+TASK_TITLE_LIMIT = 100
+# Меньше этого пределы не ужимаются, даже если страница всё ещё длинная
+TASK_MIN_LIMIT = 20
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+STATUS_BUTTONS = (
+    ("done", "✅"),
+    ("wip", "🔄"),
+    ("reviewed", "👁️"),
+    ("reset", "↩️"),
+)
+STATUS_VALUES = {
+    "done": "готово",
+    "wip": "в работе",
+    "reviewed": "просмотренно",
+    "reset": "ещё не смотрел",
+}
+# Повторное нажатие той же кнопки в течение этого времени игнорируется
+STATUS_DEBOUNCE_SECONDS = 1.5
+_recent_presses: Dict[Tuple[int, str], float] = {}
+
+def _shorten(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def _debounced(user_id: int, data: str) -> bool:
+    """True, если эта же кнопка только что нажималась этим пользователем."""
+    now = time.monotonic()
+    key = (user_id, data)
+    if now - _recent_presses.get(key, float("-inf")) < STATUS_DEBOUNCE_SECONDS:
+        return True
+    _recent_presses[key] = now
+    if len(_recent_presses) > 1000:
+        for stale in [k for k, pressed in _recent_presses.items() if now - pressed >= STATUS_DEBOUNCE_SECONDS]:
+            del _recent_presses[stale]
+    return False
+
+def _first_task_id(markup: Optional[InlineKeyboardMarkup]) -> Optional[int]:
+    # Первая строка клавиатуры страницы — кнопки статуса её первой задачи
+    if not markup or not markup.inline_keyboard:
+        return None
+    data = markup.inline_keyboard[0][0].callback_data or ""
+    if not data.startswith("status_"):
+        return None
+    return int(data.rsplit("_", 1)[1])
+
+def _task_block(number: int, task, title_limit: int, description_limit: int) -> str:
+    title = _shorten(task['practice_name'] or task['description'], title_limit)
+    return (
+        f"<b>{number}.</b> 📄 <b>Практика:</b> {escape(title)}\n"
+        f"📅 <b>До:</b> {task['end_date']}\n"
+        f"📝 <b>Статус:</b> {task['status']}\n"
+        f"💬 <b>Описание:</b> {escape(_shorten(task['description'], description_limit))}"
+    )
+
+def _render_tasks_text(tasks) -> str:
+    """Текст страницы; если он не влезает в сообщение, заголовки и описания ужимаются вдвое, пока не влезет."""
+    header = "📋 <b>Ваши задачи</b>\n✅ готово · 🔄 в работе · 👁️ просмотренно · ↩️ вернуть"
+    title_limit, description_limit = TASK_TITLE_LIMIT, TASK_DESCRIPTION_LIMIT
+    while True:
+        text = "\n\n".join([header] + [
+            _task_block(number, task, title_limit, description_limit)
+            for number, task in enumerate(tasks, start=1)
+        ])
+        if len(text) <= TELEGRAM_MESSAGE_LIMIT or description_limit <= TASK_MIN_LIMIT:
+            return text
+        title_limit = max(TASK_MIN_LIMIT, title_limit // 2)
+        description_limit = max(TASK_MIN_LIMIT, description_limit // 2)
+
+def _render_tasks_page(tasks, has_prev: bool, has_next: bool):
+    keyboard = []
+    for number, task in enumerate(tasks, start=1):
+        keyboard.append([
+            InlineKeyboardButton(text=f"{number} {icon}", callback_data=f"status_{code}_{task['id']}")
+            for code, icon in STATUS_BUTTONS
+        ])
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"tasks_prev_{tasks[0]['id']}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Дальше ➡️", callback_data=f"tasks_next_{tasks[-1]['id']}"))
+    if navigation:
+        keyboard.append(navigation)
+    return _render_tasks_text(tasks), InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 @user_router.message(F.text == "📋 Мои задачи")
-async def show_tasks(message: Message):
-    user = await get_user_by_tg_id(message.from_user.id)
+async def show_tasks(message: Message, user):
     if not user:
         return
-    tasks = await get_tasks_by_user_id(user["id"])
+    tasks, has_prev, has_next = await get_tasks_page(user["id"], limit=TASKS_PER_PAGE)
     if not tasks:
         await message.answer("📭 У вас пока нет задач.")
         return
-    for task in tasks:
-        txt = (
-            f"📄 <b>Практика:</b> {task['practice_name'] or task['description']}\n"
-            f"📅 <b>До:</b> {task['end_date']}\n"
-            f"📝 <b>Статус:</b> {task['status']}\n"
-            f"💬 <b>Описание:</b> {task['description']}"
-        )
-        await message.answer(
-            txt,
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="✅ готово", callback_data=f"status_done_{task['id']}")],
-                [InlineKeyboardButton(text="🔄 в работе", callback_data=f"status_wip_{task['id']}")],
-                [InlineKeyboardButton(text="👁️ просмотренно", callback_data=f"status_reviewed_{task['id']}")],
-                [InlineKeyboardButton(text="↩️ вернуть", callback_data=f"status_reset_{task['id']}")]
-            ])
-        )
+    text, markup = _render_tasks_page(tasks, has_prev, has_next)
+    await message.answer(text, parse_mode="HTML", reply_markup=markup)
+
+@user_router.callback_query(F.data.startswith(("tasks_next_", "tasks_prev_")))
+async def turn_tasks_page(callback: CallbackQuery, user):
+    if not user:
+        await callback.answer()
+        return
+    _, direction, anchor = callback.data.split("_")
+    if direction == "next":
+        page = await get_tasks_page(user["id"], after_id=int(anchor), limit=TASKS_PER_PAGE)
+    else:
+        page = await get_tasks_page(user["id"], before_id=int(anchor), limit=TASKS_PER_PAGE)
+    tasks, has_prev, has_next = page
+    if not tasks:
+        await callback.answer("📭 Здесь задач больше нет.")
+        return
+    await _edit_tasks_page(callback.message, tasks, has_prev, has_next)
+    await callback.answer()
+
+@user_router.callback_query(F.data.regexp(r"^status_(done|wip|reviewed|reset)_\d+$"))
+async def change_task_status(callback: CallbackQuery, user):
+    if not user:
+        await callback.answer()
+        return
+    if _debounced(callback.from_user.id, callback.data):
+        await callback.answer()
+        return
+    _, code, task_id = callback.data.split("_")
+    status = STATUS_VALUES[code]
+    if not await set_task_status(int(task_id), user["id"], status):
+        # Чужая или удалённая задача, либо статус уже такой
+        await callback.answer("Статус не изменился")
+        return
+    await callback.answer(f"📝 Статус: {status}")
+    first_id = _first_task_id(callback.message.reply_markup) if callback.message else None
+    if first_id is None:
+        return
+    # Та же страница: keyset от её первой задачи
+    tasks, has_prev, has_next = await get_tasks_page(user["id"], after_id=first_id - 1, limit=TASKS_PER_PAGE)
+    if tasks:
+        await _edit_tasks_page(callback.message, tasks, has_prev, has_next)
+
+async def _edit_tasks_page(message: Message, tasks, has_prev: bool, has_next: bool):
+    text, markup = _render_tasks_page(tasks, has_prev, has_next)
+    try:
+        await message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+    except TelegramBadRequest as e:
+        # Двойное нажатие: страница уже показана, Telegram отвечает «message is not modified»
+        if "message is not modified" not in str(e):
+            raise
 
 def register_user_handlers(dp):
     dp.include_router(user_router)
@@ -0,0 +1,316 @@
+# loadtest.py
+"""Нагрузочный прогон бота целиком: настоящий Dispatcher и роутеры против заглушки Bot API.
+
+Преподаватели жмут /start и «📋 Мои задачи», новички регистрируются по ФИО, админы
+выгружают задачи и загружают Excel. Каждый виртуальный пользователь шлёт апдейты
+по очереди, как живой человек; одновременно активны не больше --concurrency пользователей.
+
+    python loadtest.py --teachers 2000 --admins 5 --latency 0.05 --rate-limit 0.01
+
+--mode polling (по умолчанию) — апдейты идут через getUpdates заглушки и start_polling;
+--mode direct — сразу в dp.feed_update, без сетевого круга за апдейтами.
+Отчёт (JSON в stdout): p50/p95/p99 времени обработки по шагам и пропускная способность.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+# main.py требует токен при импорте; бот всё равно ходит только в заглушку
+LOAD_TEST_TOKEN = "123456:LOAD-TEST"
+os.environ.setdefault("BOT_TOKEN", LOAD_TEST_TOKEN)
+
+import database
+from benchmark import TG_ID_BASE, build_xlsx
+from main import build_dispatcher
+from utils.excel import PARSE_CHUNK_SIZE, parse_excel_from_bytes
+from utils.executor import shutdown_executor
+from utils.fake_bot_api import FakeBotAPI
+
+# Telegram id новичков, которых нет в базе
+NEWCOMER_ID_BASE = 2 * 10 ** 9
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу; None для пустой выборки."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies: List[float], errors: int = 0) -> Dict:
+    """Сводка по выборке времён в секундах: число, ошибки, перцентили и максимум в миллисекундах."""
+    summary = {"count": len(latencies), "errors": errors}
+    for pct in PERCENTILES:
+        value = percentile(latencies, pct)
+        summary[f"p{pct}_ms"] = round(value * 1000, 2) if value is not None else None
+    summary["max_ms"] = round(max(latencies) * 1000, 2) if latencies else None
+    return summary
+
+
+class LoadDriver:
+    """Шлёт апдейты виртуальных пользователей в диспетчер и меряет время их обработки."""
+
+    def __init__(self, api: FakeBotAPI, bot: Bot, dp, mode: str = "polling"):
+        self.api = api
+        self.bot = bot
+        self.dp = dp
+        self.mode = mode
+        self.handler: Dict[str, List[float]] = defaultdict(list)
+        self.end_to_end: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._steps: Dict[int, str] = {}
+        self._done: Dict[int, asyncio.Future] = {}
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._instrument()
+
+    def _instrument(self):
+        """Оборачивает dp.feed_update: и polling, и прямой режим проходят через него."""
+        feed_update = self.dp.feed_update
+
+        async def timed_feed_update(bot, update, **kwargs):
+            step = self._steps.pop(update.update_id, "other")
+            started = time.perf_counter()
+            try:
+                return await feed_update(bot, update, **kwargs)
+            except Exception:
+                self.errors[step] += 1
+            finally:
+                self.handler[step].append(time.perf_counter() - started)
+                done = self._done.pop(update.update_id, None)
+                if done is not None and not done.done():
+                    done.set_result(None)
+
+        self.dp.feed_update = timed_feed_update
+
+    # === Апдейты ===
+
+    def _user(self, tg_id: int) -> dict:
+        return {"id": tg_id, "is_bot": False, "first_name": f"User{tg_id}"}
+
+    def _message(self, tg_id: int, **fields) -> dict:
+        return {
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": tg_id, "type": "private"},
+                "from": self._user(tg_id),
+                **fields,
+            }
+        }
+
+    def text(self, tg_id: int, text: str) -> dict:
+        return self._message(tg_id, text=text)
+
+    def document(self, tg_id: int, content: bytes, file_name: str) -> dict:
+        file_id = self.api.add_file(content, file_name)
+        return self._message(tg_id, document={
+            "file_id": file_id, "file_unique_id": file_id, "file_name": file_name, "file_size": len(content),
+        })
+
+    def callback(self, tg_id: int, data: str) -> dict:
+        return {
+            "callback_query": {
+                "id": str(next(self._message_ids)),
+                "from": self._user(tg_id),
+                "chat_instance": str(tg_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": tg_id, "type": "private"},
+                    "text": "📥 Выберите формат выгрузки:",
+                },
+            }
+        }
+
+    async def send(self, step: str, update: dict):
+        """Отправляет апдейт и ждёт конца его обработки, как пользователь ждёт ответа."""
+        started = time.perf_counter()
+        if self.mode == "direct":
+            update_id = next(self._update_ids)
+            self._steps[update_id] = step
+            await self.dp.feed_update(self.bot, Update.model_validate({**update, "update_id": update_id}))
+        else:
+            done = asyncio.get_running_loop().create_future()
+            update_id = self.api.push_update(update)
+            self._steps[update_id] = step
+            self._done[update_id] = done
+            await done
+        self.end_to_end[step].append(time.perf_counter() - started)
+
+    # === Сценарии ===
+
+    async def teacher(self, tg_id: int):
+        await self.send("start", self.text(tg_id, "/start"))
+        await self.send("my_tasks", self.text(tg_id, "📋 Мои задачи"))
+
+    async def newcomer(self, tg_id: int):
+        await self.send("start_new", self.text(tg_id, "/start"))
+        await self.send("register", self.text(tg_id, f"Новиков{tg_id} Гость Тестович"))
+
+    async def admin(self, tg_id: int, upload: bytes, export_format: str):
+        await self.send("export_menu", self.text(tg_id, "📥 Выгрузить все задачи"))
+        await self.send("export", self.callback(tg_id, f"export:{export_format}"))
+        await self.send("upload", self.document(tg_id, upload, "задачи.xlsx"))
+
+    def report(self) -> Dict:
+        steps = sorted(set(self.handler) | set(self.end_to_end))
+        report = {
+            "handler": {step: summarize(self.handler[step], self.errors[step]) for step in steps},
+            "overall": summarize([value for values in self.handler.values() for value in values],
+                                 sum(self.errors.values())),
+        }
+        if self.mode == "polling":
+            # От постановки в getUpdates до конца обработки: видно очередь перед диспетчером
+            report["end_to_end"] = {step: summarize(self.end_to_end[step]) for step in steps}
+        return report
+
+
+async def seed_database(tasks: int, admins: int) -> List[int]:
+    """Наполняет свежую базу задачами, привязывает преподавателей к Telegram и назначает админов.
+
+    Возвращает Telegram id преподавателей; первые admins из них — админы.
+    """
+    await database.init_db()
+    parsed = parse_excel_from_bytes(BytesIO(build_xlsx(tasks)))
+    await database.add_tasks_from_excel(
+        [parsed[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(parsed), PARSE_CHUNK_SIZE)]
+    )
+    async with database.connection() as db:
+        await db.execute("UPDATE users SET tg_user_id = ? + id WHERE tg_user_id IS NULL", (TG_ID_BASE,))
+        await db.execute(
+            "UPDATE users SET is_admin = 1 WHERE id IN (SELECT id FROM users WHERE tg_user_id >= ? ORDER BY id LIMIT ?)",
+            (TG_ID_BASE, admins)
+        )
+        await db.commit()
+        async with db.execute("SELECT tg_user_id FROM users WHERE tg_user_id >= ? ORDER BY id", (TG_ID_BASE,)) as cursor:
+            return [row["tg_user_id"] for row in await cursor.fetchall()]
+
+
+async def run_load(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    database.DB_PATH = os.path.join(workdir, "tasks.db")
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_limit, args.retry_after, seed=args.seed)
+    bot = dp = polling = None
+    try:
+        tg_ids = await seed_database(args.tasks, args.admins)
+        admin_ids, teacher_ids = tg_ids[:args.admins], tg_ids[args.admins:]
+        rnd = random.Random(args.seed)
+        teacher_ids = [rnd.choice(teacher_ids) for _ in range(args.teachers)] if teacher_ids else []
+        # У каждого админа свой файл, иначе все загрузки, кроме первой, уйдут в дедупликацию
+        uploads = [build_xlsx(args.upload_rows, seed=args.seed + 1 + i) for i in range(len(admin_ids))]
+
+        base_url = await api.start(port=args.port)
+        bot = Bot(token=LOAD_TEST_TOKEN, session=AiohttpSession(
+            api=TelegramAPIServer.from_base(base_url), limit=args.concurrency
+        ))
+        dp = build_dispatcher(bot)
+        driver = LoadDriver(api, bot, dp, args.mode)
+        if args.mode == "polling":
+            polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+        scenarios = [driver.teacher(tg_id) for tg_id in teacher_ids]
+        scenarios += [driver.newcomer(NEWCOMER_ID_BASE + i) for i in range(args.newcomers)]
+        scenarios += [driver.admin(tg_id, upload, args.export_format) for tg_id, upload in zip(admin_ids, uploads)]
+        rnd.shuffle(scenarios)
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited(scenario):
+            async with semaphore:
+                await scenario
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(scenario) for scenario in scenarios))
+        elapsed = time.perf_counter() - started
+
+        report = driver.report()
+        updates = report["overall"]["count"]
+        report["meta"] = {
+            "mode": args.mode,
+            "teachers": len(teacher_ids),
+            "newcomers": args.newcomers,
+            "admins": len(admin_ids),
+            "tasks": args.tasks,
+            "concurrency": args.concurrency,
+            "latency": args.latency,
+            "rate_limit": args.rate_limit,
+            "python": platform.python_version(),
+        }
+        report["duration_sec"] = round(elapsed, 3)
+        report["updates"] = updates
+        report["throughput_updates_per_sec"] = round(updates / elapsed, 1) if elapsed else None
+        report["api"] = api.stats()
+        return report
+    finally:
+        if polling is not None:
+            # start_polling сам закрывает HTTP-сессию бота
+            await dp.stop_polling()
+            await polling
+        elif bot is not None:
+            await bot.session.close()
+        await api.stop()
+        shutdown_executor()
+        await database.close_db()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота против заглушки Bot API")
+    parser.add_argument("--mode", choices=("polling", "direct"), default="polling")
+    parser.add_argument("--teachers", type=int, default=1000, help="сессий преподавателей: /start + «Мои задачи»")
+    parser.add_argument("--newcomers", type=int, default=100, help="регистраций новых пользователей")
+    parser.add_argument("--admins", type=int, default=3, help="админов: выгрузка + загрузка Excel")
+    parser.add_argument("--tasks", type=int, default=10000, help="задач в базе перед прогоном")
+    parser.add_argument("--upload-rows", type=int, default=200, help="строк в загружаемом админом xlsx")
+    parser.add_argument("--export-format", default="csv", help="формат выгрузки админа: xlsx, csv, csv.gz, jsonl")
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременно активных пользователей")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа заглушки, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, до N сек")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429, 0..1")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, сек")
+    parser.add_argument("--port", type=int, default=0, help="порт заглушки (0 — любой свободный)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="куда сохранить JSON (по умолчанию — stdout)")
+    args = parser.parse_args()
+
+    # Хендлеры и бот печатают в stdout; там должен остаться только JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run_load(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    overall = report["overall"]
+    print(
+        f"📈 {report['updates']} апдейтов за {report['duration_sec']} с "
+        f"({report['throughput_updates_per_sec']}/с), p50 {overall['p50_ms']} мс, "
+        f"p95 {overall['p95_ms']} мс, p99 {overall['p99_ms']} мс, ошибок {overall['errors']}",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
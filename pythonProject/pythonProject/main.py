@@ -1,31 +1,160 @@
+import time
+STARTED = time.perf_counter()
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+from utils.startup import StartupProfile
+# STARTUP_PROFILE=1 — разбивка времени импортов по пакетам и этапы запуска до первого апдейта;
+# STARTUP_PROFILE_FILE — куда дополнительно сохранить профиль в JSON (чтобы сравнивать между выкладками).
+# Импорты засекаются только при запуске main.py, не в воркерах и не при импорте из loadtest.py
+STARTUP = StartupProfile(
+    STARTED,
+    os.getenv("STARTUP_PROFILE", "0") != "0" and __name__ == "__main__",
+    os.getenv("STARTUP_PROFILE_FILE"),
+)
+
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from tzlocal import get_localzone
-from dotenv import load_dotenv
-import os
 
-from database import init_db
+from database import init_db, close_db, configure_pool
 from handlers import register_all_handlers
 from utils.scheduler import setup_scheduler
+from utils.executor import setup_executor, shutdown_executor
+from utils.metrics import REGISTRY, FSM_STATES, STARTUP_SECONDS, start_metrics_server
+from utils.middlewares import UserMiddleware, setup_metrics_middleware
+from utils.querylog import QUERY_LOG
+from utils.fsm_storage import SQLiteStorage
 
-load_dotenv()
+STARTUP.mark("imports")
 TOKEN = os.getenv("BOT_TOKEN")
 if not TOKEN:
     raise ValueError("❌ BOT_TOKEN не задан в .env")
+# Пул потоков для openpyxl: EXCEL_WORKERS=размер (0 — по умолчанию)
+EXCEL_WORKERS = int(os.getenv("EXCEL_WORKERS", "0")) or None
+# Разбор и выгрузка идут потоково через объекты с состоянием, в другой процесс их не передать
+if os.getenv("EXCEL_EXECUTOR", "thread") != "thread":
+    print("⚠️ EXCEL_EXECUTOR больше не поддерживается: Excel обрабатывается в пуле потоков")
+# REMINDER_DIGEST=0 — по сообщению на каждую задачу вместо сводки на преподавателя
+REMINDER_DIGEST = os.getenv("REMINDER_DIGEST", "1") != "0"
+# REMINDER_PRECISE=0 — старый режим: один проход по задачам в 9:00
+REMINDER_PRECISE = os.getenv("REMINDER_PRECISE", "1") != "0"
+# BOT_MODE=webhook — принимать апдейты HTTP-сервером вместо long polling
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Публичный адрес (https://example.com) для setWebhook; пусто — сервер только слушает локально
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# UPDATE_WORKERS=N (>1) — апдейты обрабатывают N процессов, этот процесс только принимает их и шлёт напоминания
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "1"))
+# METRICS_PORT — отдавать метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено).
+# При UPDATE_WORKERS > 1 метрики хендлеров воркера i — на порту METRICS_PORT + 1 + i
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# SLOW_QUERY_MS — SQL дольше этого пишется в лог вместе с планом запроса (0 — не писать)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# DB_POOL_SIZE — соединений с tasks.db на процесс (0 — по умолчанию). DB_POOL_TIMEOUT — сколько секунд
+# запрос ждёт свободное соединение, прежде чем упасть с ошибкой
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0")) or None
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "0")) or None
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"❌ Неизвестный BOT_MODE: {BOT_MODE}")
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise ValueError("❌ WEBHOOK_SECRET не задан в .env")
+if BOT_MODE == "webhook" and UPDATE_WORKERS > 1:
+    raise ValueError("❌ UPDATE_WORKERS > 1 поддерживается только в режиме polling")
+
+def create_bot() -> Bot:
+    # TELEGRAM_API_URL — свой сервер Bot API (локальный telegram-bot-api или тестовая заглушка)
+    api_url = os.getenv("TELEGRAM_API_URL")
+    if api_url:
+        return Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    return Bot(token=TOKEN)
+
+def build_dispatcher(bot: Bot) -> Dispatcher:
+    # FSM в tasks.db: незавершённые диалоги админки не теряются при перезапуске
+    dp = Dispatcher(storage=SQLiteStorage())
+    # Первым снаружи: в замер хендлера входит и загрузка пользователя
+    setup_metrics_middleware(dp)
+    # Пользователь грузится один раз на апдейт (из кэша) и приходит в хендлеры аргументом user
+    dp.update.outer_middleware(UserMiddleware())
+    register_all_handlers(dp, bot)
+    return dp
+
+def setup_metrics(storage: SQLiteStorage):
+    async def collect_fsm_states():
+        FSM_STATES.replace({(state,): count for state, count in (await storage.count_states()).items()})
+
+    async def collect_startup():
+        STARTUP_SECONDS.replace({(stage,): seconds for stage, seconds in STARTUP.stages.items()})
+
+    REGISTRY.add_collector(collect_fsm_states)
+    REGISTRY.add_collector(collect_startup)
+
+def setup_query_log():
+    QUERY_LOG.threshold = SLOW_QUERY_MS / 1000 if SLOW_QUERY_MS > 0 else None
+
+def setup_worker():
+    logging.basicConfig(level=logging.INFO)
+    setup_query_log()
+    configure_pool(DB_POOL_SIZE, DB_POOL_TIMEOUT)
+    setup_executor(EXCEL_WORKERS)
 
 async def main():
+    setup_query_log()
+    configure_pool(DB_POOL_SIZE, DB_POOL_TIMEOUT)
     await init_db()
-    bot = Bot(token=TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    STARTUP.mark("db")
+    setup_executor(EXCEL_WORKERS)
+    bot = create_bot()
+    dp = build_dispatcher(bot)
+    dp.update.outer_middleware(STARTUP.first_update_middleware)
+    STARTUP.mark("dispatcher")
+    await dp.fsm.storage.purge_expired()
     scheduler = AsyncIOScheduler(timezone=get_localzone())
-    register_all_handlers(dp, bot)
-    setup_scheduler(scheduler, bot)
+    reminder_scheduler = setup_scheduler(scheduler, bot, REMINDER_DIGEST, REMINDER_PRECISE)
+    scheduler.add_job(dp.fsm.storage.purge_expired, "interval", hours=1)
     scheduler.start()
+    metrics_runner = None
+    if METRICS_PORT:
+        setup_metrics(dp.fsm.storage)
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    STARTUP.mark("ready")
     print("✅ Бот запущен!")
-    await dp.start_polling(bot, handle_signals=False)
+    try:
+        # Модули режимов грузятся, только если режим выбран
+        if BOT_MODE == "webhook":
+            from utils.webhook import run_webhook
+
+            await run_webhook(dp, bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL)
+        elif UPDATE_WORKERS > 1:
+            from utils.workers import UpdateFanout
+
+            # Апдейты обрабатывают воркеры, этот процесс их не видит: профиль — до готовности
+            STARTUP.finish()
+            fanout = UpdateFanout(
+                create_bot, build_dispatcher, UPDATE_WORKERS, init=setup_worker,
+                on_reminder=reminder_scheduler.notify if reminder_scheduler is not None else None,
+                metrics_host=METRICS_HOST, metrics_port=METRICS_PORT + 1 if METRICS_PORT else None,
+            )
+            await fanout.run(bot, dp.resolve_used_update_types())
+        else:
+            await dp.start_polling(bot, handle_signals=False)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        scheduler.shutdown(wait=False)
+        if reminder_scheduler is not None:
+            await reminder_scheduler.stop()
+        shutdown_executor()
+        await close_db()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
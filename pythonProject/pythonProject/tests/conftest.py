@@ -0,0 +1,30 @@
+# tests/conftest.py
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Модули бота импортируются от корня проекта, как при запуске main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """Пустая tasks.db во временном каталоге; рабочая база не трогается."""
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "tasks.db")
+    database.forget_cached_user(None)
+
+    def run(coro_factory):
+        async def scenario():
+            await database.init_db()
+            try:
+                return await coro_factory()
+            finally:
+                await database.close_db()
+
+        return asyncio.run(scenario())
+
+    return run
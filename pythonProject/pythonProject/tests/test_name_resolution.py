@@ -0,0 +1,67 @@
+# tests/test_name_resolution.py
+"""Сопоставление ФИО: варианты записи одного преподавателя не плодят пользователей ни при импорте, ни при регистрации."""
+import database
+
+VARIANTS = ("Иванов И.И.", "иванов  и. и.", "Иванов Иван Иванович")
+
+
+def _task(full_name: str, description: str = "Отчёт") -> dict:
+    return {"full_name": full_name, "practice_name": None, "description": description,
+            "start_date": None, "end_date": "2030-01-01"}
+
+
+async def _ivanovs():
+    async with database.connection() as db:
+        async with db.execute("SELECT id FROM users WHERE name_key LIKE 'иванов%' ORDER BY id") as cursor:
+            return [row["id"] for row in await cursor.fetchall()]
+
+
+def test_variants_resolve_to_one_user(fresh_db):
+    async def scenario():
+        added = await database.add_tasks_from_excel([[_task(name, f"Задача {i}") for i, name in enumerate(VARIANTS)]])
+        users = await _ivanovs()
+        found = [[user["id"] for user in await database.get_user_by_full_name(name)] for name in VARIANTS]
+        created = [await database.get_or_create_user_by_full_name(name) for name in VARIANTS]
+        tasks = await database.get_user_tasks_by_full_name("Иванов И.И.")
+        return added, users, found, created, len(tasks), await _ivanovs()
+
+    added, users, found, created, tasks, users_after = fresh_db(scenario)
+    assert added == 3
+    assert len(users) == 1
+    assert found == [users] * len(VARIANTS)
+    assert created == users * len(VARIANTS)
+    assert tasks == 3
+    assert users_after == users
+
+
+def test_ambiguous_initials_are_not_guessed(fresh_db):
+    async def scenario():
+        await database.add_tasks_from_excel([[_task("Иванов Иван Иванович"), _task("Иванов Игорь Ильич")]])
+        return await database.get_user_by_full_name("Иванов И.И."), await _ivanovs()
+
+    found, users = fresh_db(scenario)
+    assert found == []
+    assert len(users) == 2
+
+
+def test_names_without_letters_are_skipped(fresh_db):
+    async def scenario():
+        added = await database.add_tasks_from_excel([[_task("..."), _task("   "), _task(""), _task("Петров П.")]])
+        created = await database.get_or_create_user_by_full_name("... ...")
+        async with database.connection() as db:
+            async with db.execute("SELECT COUNT(*) FROM users WHERE name_key IS NULL") as cursor:
+                keyless = (await cursor.fetchone())[0]
+        return added, created, keyless
+
+    assert fresh_db(scenario) == (1, None, 0)
+
+
+def test_registration_links_imported_user(fresh_db):
+    async def scenario():
+        await database.add_tasks_from_excel([[_task("Иванов И.И.")]])
+        imported = await _ivanovs()
+        user_id = await database.register_user(42, "Иванов Иван Иванович", "ivanov", None)
+        return imported, user_id, await _ivanovs()
+
+    imported, user_id, users = fresh_db(scenario)
+    assert users == imported == [user_id]
@@ -0,0 +1,92 @@
+# tests/test_outbox.py
+"""Очередь напоминаний: каждое сообщение уходит ровно один раз, даже после падения и повторных проходов."""
+import database
+from benchmark import FakeBot
+from utils.outbox import OUTBOX_MAX_ATTEMPTS, deliver_outbox
+from utils.scheduler import send_reminders
+
+DUE_SLOT = "2025-07-20 14:30:00"
+
+
+class FailingBot(FakeBot):
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        self.sent += 1
+        raise RuntimeError("chat not found")
+
+
+async def _add_due_task() -> int:
+    async with database.connection() as db:
+        cursor = await db.execute("INSERT INTO users (full_name, tg_user_id) VALUES ('Иванов Иван', 5)")
+        user_id = cursor.lastrowid
+        cursor = await db.execute(
+            "INSERT INTO tasks (user_id, status, description, end_date, next_reminder) "
+            "VALUES (?, 'в работе', 'Отчёт', '2030-01-01', ?)",
+            (user_id, DUE_SLOT)
+        )
+        await db.commit()
+        return cursor.lastrowid
+
+
+async def _outbox_states():
+    async with database.connection() as db:
+        async with db.execute("SELECT state, attempts FROM reminder_outbox ORDER BY id") as cursor:
+            return [tuple(row) for row in await cursor.fetchall()]
+
+
+def test_sending_rows_are_resent_once(fresh_db):
+    async def scenario():
+        # Процесс упал между пометкой 'sending' и отправкой
+        async with database.connection() as db:
+            await db.execute("INSERT INTO reminder_outbox (chat_id, text, state) VALUES (5, 'Напоминание', 'sending')")
+            await db.commit()
+        bot = FakeBot()
+        await deliver_outbox(bot)
+        await deliver_outbox(bot)
+        return bot.sent, await _outbox_states()
+
+    sent, states = fresh_db(scenario)
+    assert sent == 1
+    assert states == [("sent", 1)]
+
+
+def test_second_pass_in_same_slot_queues_nothing(fresh_db):
+    async def scenario():
+        await _add_due_task()
+        bot = FakeBot()
+        first = await send_reminders(bot)
+        second = await send_reminders(bot)
+        return first.queued, second.queued, bot.sent
+
+    assert fresh_db(scenario) == (1, 0, 1)
+
+
+def test_rearmed_slot_sends_exactly_one_new_message(fresh_db):
+    async def scenario():
+        task_id = await _add_due_task()
+        bot = FakeBot()
+        await send_reminders(bot)
+        # Админ вернул напоминание на тот же, уже отправленный срок
+        await database.update_task_reminder(task_id, DUE_SLOT)
+        rearmed = await send_reminders(bot)
+        await send_reminders(bot)
+        return rearmed.queued, bot.sent
+
+    assert fresh_db(scenario) == (1, 2)
+
+
+def test_failed_after_max_attempts(fresh_db):
+    async def scenario():
+        await _add_due_task()
+        bot = FailingBot()
+        await send_reminders(bot)
+        states = [await _outbox_states()]
+        for _ in range(OUTBOX_MAX_ATTEMPTS):
+            await deliver_outbox(bot)
+            states.append(await _outbox_states())
+        return bot.sent, states
+
+    sent, states = fresh_db(scenario)
+    # Последний проход уже ничего не отправляет
+    assert sent == OUTBOX_MAX_ATTEMPTS
+    assert states[:OUTBOX_MAX_ATTEMPTS - 1] == [[("pending", attempt)] for attempt in range(1, OUTBOX_MAX_ATTEMPTS)]
+    assert states[OUTBOX_MAX_ATTEMPTS - 1:] == [[("failed", OUTBOX_MAX_ATTEMPTS)]] * 2
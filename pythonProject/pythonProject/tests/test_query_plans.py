@@ -0,0 +1,16 @@
+# tests/test_query_plans.py
+"""Горячие запросы идут по индексам: полный SCAN таблицы должен ронять тест, а не только печататься при старте."""
+import database
+
+
+def test_hot_queries_do_not_scan_tables(fresh_db):
+    assert fresh_db(database.check_query_plans) == {}
+
+
+def test_missing_index_is_reported(fresh_db):
+    async def without_due_index():
+        async with database.connection() as db:
+            await db.execute("DROP INDEX idx_tasks_due_reminder")
+        return await database.check_query_plans()
+
+    assert "due_reminders" in fresh_db(without_due_index)
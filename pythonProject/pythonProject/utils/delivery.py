@@ -0,0 +1,130 @@
+# utils/delivery.py
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+CONCURRENCY = 10
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    """Классическое «ведро токенов»: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class Outgoing:
+    chat_id: int
+    text: str
+    # Что вернуть в отчёте при успешной доставке (например, id задачи)
+    key: Any = None
+    parse_mode: Optional[str] = "HTML"
+
+
+@dataclass
+class DeliveryReport:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    delivered: List[Any] = field(default_factory=list)
+    # Сколько сообщений send_reminders поставил в очередь в этом проходе
+    queued: int = 0
+
+
+class DeliveryEngine:
+    """Параллельная отправка сообщений с ограничением частоты и повтором после 429."""
+
+    def __init__(self, bot, concurrency: int = CONCURRENCY, global_rate: float = GLOBAL_RATE,
+                 per_chat_rate: float = PER_CHAT_RATE, max_retries: int = MAX_RETRIES):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        # После retry_after Telegram ждёт паузы от всего бота, а не только от одного чата
+        self._paused_until = 0.0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def _wait_pause(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, message: Outgoing, report: DeliveryReport, on_delivered=None):
+        for attempt in range(self.max_retries + 1):
+            await self._chat_bucket(message.chat_id).acquire()
+            await self._wait_pause()
+            await self._global.acquire()
+            try:
+                await self.bot.send_message(message.chat_id, message.text, parse_mode=message.parse_mode)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    break
+                report.retried += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                continue
+            except TelegramNetworkError:
+                if attempt == self.max_retries:
+                    break
+                report.retried += 1
+                await asyncio.sleep(2 ** attempt)
+                continue
+            except Exception as e:
+                print(f"Не удалось отправить сообщение пользователю {message.chat_id}: {e}")
+                report.failed += 1
+                return
+            report.sent += 1
+            report.delivered.append(message.key)
+            if on_delivered is not None:
+                await on_delivered(message)
+            return
+        print(f"Не удалось отправить сообщение пользователю {message.chat_id}: исчерпаны повторы")
+        report.failed += 1
+
+    async def deliver(self, messages: Iterable[Outgoing],
+                      on_delivered: Optional[Callable[[Outgoing], Awaitable[None]]] = None) -> DeliveryReport:
+        """Отправляет сообщения; on_delivered вызывается сразу после каждой успешной отправки."""
+        report = DeliveryReport()
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+
+        async def worker():
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._send(message, report, on_delivered)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()))))
+        return report
@@ -1,116 +1,193 @@
 # utils/excel.py
+# openpyxl импортируется внутри функций: он нужен только админке, а стоит ~0.1 с на каждом старте бота
 import re
 import tempfile
 import os
 from datetime import datetime
-from openpyxl import Workbook, load_workbook
-from typing import List, Dict, Optional
+from io import BytesIO
+from typing import Iterator, List, Dict, Optional
 
 
 # ======================
 # ЭКСПОРТ (для админа)
 # ======================
 
+EXPORT_HEADERS = [
+    "practice_name", "start_date", "end_date", "full_name",
+    "tg_username", "phone", "task_description", "status", "next_reminder"
+]
+
+
+def _export_row(task) -> list:
+    return [
+        task["practice_name"],
+        task["start_date"] or "",
+        task["end_date"],
+        task["full_name"],
+        task["tg_username"] or "—",
+        task["phone"] or "—",
+        task["task_description"],
+        task["status"],
+        task["next_reminder"] or ""
+    ]
+
+
+class ExcelExportWriter:
+    """Потоковая выгрузка: write-only книга openpyxl сбрасывает строки на диск по мере записи."""
+
+    extension = "xlsx"
+
+    def __init__(self):
+        from openpyxl import Workbook
+
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet("Все задачи")
+        self.ws.append(EXPORT_HEADERS)
+        self.rows = 0
+
+    def append(self, tasks):
+        for task in tasks:
+            self.ws.append(_export_row(task))
+            self.rows += 1
+
+    def save(self) -> str:
+        """Сохраняет книгу во временный файл и возвращает путь к нему."""
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
+            path = tmp.name
+        try:
+            self.wb.save(path)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+
+    def discard(self):
+        """Бросает недописанную выгрузку и удаляет временный файл, в который openpyxl пишет строки листа."""
+        self.ws.close()
+        self.ws._writer.cleanup()
+
+
 def export_tasks_to_excel(tasks) -> str:
     """Генерирует Excel-файл со всеми задачами и возвращает путь к нему."""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Все задачи"
-    headers = [
-        "practice_name", "start_date", "end_date", "full_name",
-        "tg_username", "phone", "task_description", "status", "next_reminder"
-    ]
-    ws.append(headers)
-    for task in tasks:
-        row = [
-            task["practice_name"],
-            task["start_date"] or "",
-            task["end_date"],
-            task["full_name"],
-            task["tg_username"] or "—",
-            task["phone"] or "—",
-            task["task_description"],
-            task["status"],
-            task["next_reminder"] or ""
-        ]
-        ws.append(row)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-        wb.save(tmp.name)
-        return tmp.name
+    writer = ExcelExportWriter()
+    writer.append(tasks)
+    return writer.save()
 
 
 # ======================
 # ИМПОРТ (парсинг Excel)
 # ======================
 
-def parse_excel(file_path: str) -> List[Dict]:
-    """Парсит Excel и возвращает список задач в унифицированном формате."""
-    wb = load_workbook(file_path, read_only=True)
-    ws = wb.active
+PARSE_CHUNK_SIZE = 500
+
+
+def _cell(row, idx):
+    """Значение ячейки или None, если колонки нет или строка короче заголовка."""
+    if idx is None or idx >= len(row):
+        return None
+    # «—» — заглушка пустого значения в нашей же выгрузке
+    if row[idx] == "—":
+        return None
+    return row[idx]
+
+
+def _parse_row(row, columns: Dict[str, Optional[int]]) -> Optional[Dict]:
+    """Приводит одну строку листа к унифицированному формату задачи."""
+    if not row or not _cell(row, columns["full_name"]):
+        return None
+
+    full_name = str(_cell(row, columns["full_name"])).strip()
+    end_date = normalize_date(_cell(row, columns["end_date"]))
+    if not end_date:
+        return None
+
+    practice_name = None
+    if _cell(row, columns["practice_name"]):
+        practice_name = str(_cell(row, columns["practice_name"])).strip()
+
+    # Определяем описание
+    if _cell(row, columns["task_description"]):
+        description = str(_cell(row, columns["task_description"])).strip()
+    elif practice_name:
+        description = practice_name
+    else:
+        description = "Без описания"
+
+    start_raw = _cell(row, columns["start_date"])
+    start_date = normalize_date(start_raw) if start_raw else None
 
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
-        return []
+    tg_username = None
+    if _cell(row, columns["tg_username"]):
+        un = str(_cell(row, columns["tg_username"])).strip()
+        tg_username = un if un.startswith("@") else f"@{un}"
 
-    headers = [str(cell).strip().lower() if cell else "" for cell in rows[0]]
-    tasks = []
+    phone_raw = _cell(row, columns["phone"])
+    phone = str(phone_raw).strip() if phone_raw else None
 
+    return {
+        "full_name": full_name,
+        "practice_name": practice_name,
+        "start_date": start_date,
+        "end_date": end_date,
+        "description": description,
+        "tg_username": tg_username,
+        "phone": phone
+    }
+
+
+IMPORT_COLUMNS = ("full_name", "end_date", "practice_name", "task_description",
+                  "start_date", "tg_username", "phone")
+
+
+def iter_row_chunks(header, rows, chunk_size: int = PARSE_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """Общий движок разбора: строка заголовка + поток строк -> пачки задач.
+
+    Строки не накапливаются: в памяти одновременно держится только текущая пачка.
+    """
+    headers = [str(cell).strip().lower() if cell else "" for cell in header]
     # Проверяем, есть ли обязательные колонки
     if "full_name" not in headers or "end_date" not in headers:
         raise ValueError("Файл должен содержать колонки: full_name и end_date")
 
     # Индексы колонок
-    full_name_idx = headers.index("full_name")
-    end_date_idx = headers.index("end_date")
-
-    practice_name_idx = headers.index("practice_name") if "practice_name" in headers else None
-    task_desc_idx = headers.index("task_description") if "task_description" in headers else None
-    start_date_idx = headers.index("start_date") if "start_date" in headers else None
-    tg_username_idx = headers.index("tg_username") if "tg_username" in headers else None
-    phone_idx = headers.index("phone") if "phone" in headers else None
-
-    for row in rows[1:]:
-        if not row or not row[full_name_idx]:
-            continue
+    columns = {name: headers.index(name) if name in headers else None for name in IMPORT_COLUMNS}
 
-        full_name = str(row[full_name_idx]).strip()
-        end_date_raw = row[end_date_idx]
-        end_date = normalize_date(end_date_raw)
-        if not end_date:
+    chunk = []
+    for row in rows:
+        task = _parse_row(row, columns)
+        if task is None:
             continue
+        chunk.append(task)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
-        # Определяем описание
-        if task_desc_idx is not None and row[task_desc_idx]:
-            description = str(row[task_desc_idx]).strip()
-        elif practice_name_idx is not None and row[practice_name_idx]:
-            description = str(row[practice_name_idx]).strip()
-        else:
-            description = "Без описания"
 
-        practice_name = None
-        if practice_name_idx is not None and row[practice_name_idx]:
-            practice_name = str(row[practice_name_idx]).strip()
+def iter_excel_chunks(source, chunk_size: int = PARSE_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """Потоково читает активный лист (путь или BytesIO) и отдаёт задачи пачками."""
+    from openpyxl import load_workbook
 
-        start_date = normalize_date(row[start_date_idx]) if start_date_idx and row[start_date_idx] else None
+    wb = load_workbook(filename=source, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield from iter_row_chunks(header, rows, chunk_size)
+    finally:
+        wb.close()
 
-        tg_username = None
-        if tg_username_idx and row[tg_username_idx]:
-            un = str(row[tg_username_idx]).strip()
-            tg_username = un if un.startswith("@") else f"@{un}"
 
-        phone = str(row[phone_idx]).strip() if phone_idx and row[phone_idx] else None
+def parse_excel(file_path: str) -> List[Dict]:
+    """Парсит Excel и возвращает список задач в унифицированном формате."""
+    return [task for chunk in iter_excel_chunks(file_path) for task in chunk]
 
-        tasks.append({
-            "full_name": full_name,
-            "practice_name": practice_name,
-            "start_date": start_date,
-            "end_date": end_date,
-            "description": description,
-            "tg_username": tg_username,
-            "phone": phone
-        })
 
-    return tasks
+def parse_excel_from_bytes(file_bytes: BytesIO) -> List[Dict]:
+    """Парсит Excel из BytesIO (без сохранения на диск)."""
+    return [task for chunk in iter_excel_chunks(file_bytes) for task in chunk]
 
 
 def normalize_date(date_value) -> Optional[str]:
@@ -132,6 +209,8 @@ def normalize_date(date_value) -> Optional[str]:
         elif re.match(r"\d{4}-\d{2}-\d{2}", date_str):
             return date_str
     return None
+
+
 def create_excel_template() -> str:
     """Создаёт Excel-файл с двумя шаблонами: полным и кратким."""
     from openpyxl import Workbook
@@ -152,71 +231,3 @@ def create_excel_template() -> str:
     with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
         wb.save(tmp.name)
         return tmp.name
-
-
-from io import BytesIO
-from openpyxl import load_workbook
-
-
-def parse_excel_from_bytes(file_bytes: BytesIO) -> List[Dict]:
-    """Парсит Excel из BytesIO (без сохранения на диск)."""
-    wb = load_workbook(filename=file_bytes, read_only=True, data_only=True)
-    ws = wb.active
-    # ... остальной код как в parse_excel(), начиная с rows = list(ws.iter_rows(...))
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
-        return []
-
-    headers = [str(cell).strip().lower() if cell else "" for cell in rows[0]]
-    tasks = []
-
-    if "full_name" not in headers or "end_date" not in headers:
-        raise ValueError("Файл должен содержать колонки: full_name и end_date")
-
-    full_name_idx = headers.index("full_name")
-    end_date_idx = headers.index("end_date")
-    practice_name_idx = headers.index("practice_name") if "practice_name" in headers else None
-    task_desc_idx = headers.index("task_description") if "task_description" in headers else None
-    start_date_idx = headers.index("start_date") if "start_date" in headers else None
-    tg_username_idx = headers.index("tg_username") if "tg_username" in headers else None
-    phone_idx = headers.index("phone") if "phone" in headers else None
-
-    for row in rows[1:]:
-        if not row or not row[full_name_idx]:
-            continue
-
-        full_name = str(row[full_name_idx]).strip()
-        end_date_raw = row[end_date_idx]
-        end_date = normalize_date(end_date_raw)
-        if not end_date:
-            continue
-
-        if task_desc_idx is not None and row[task_desc_idx]:
-            description = str(row[task_desc_idx]).strip()
-        elif practice_name_idx is not None and row[practice_name_idx]:
-            description = str(row[practice_name_idx]).strip()
-        else:
-            description = "Без описания"
-
-        practice_name = None
-        if practice_name_idx is not None and row[practice_name_idx]:
-            practice_name = str(row[practice_name_idx]).strip()
-
-        start_date = normalize_date(row[start_date_idx]) if start_date_idx and row[start_date_idx] else None
-        tg_username = None
-        if tg_username_idx and row[tg_username_idx]:
-            un = str(row[tg_username_idx]).strip()
-            tg_username = un if un.startswith("@") else f"@{un}"
-        phone = str(row[phone_idx]).strip() if phone_idx and row[phone_idx] else None
-
-        tasks.append({
-            "full_name": full_name,
-            "practice_name": practice_name,
-            "start_date": start_date,
-            "end_date": end_date,
-            "description": description,
-            "tg_username": tg_username,
-            "phone": phone
-        })
-
-    return tasks
\ No newline at end of file
@@ -0,0 +1,46 @@
+# utils/executor.py
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Тяжёлая работа openpyxl уходит сюда, чтобы не стопорить event loop бота.
+# Только потоки: разбор и выгрузка идут потоково через объекты с состоянием
+# (генератор пачек, write-only книга), а их нельзя передать в другой процесс
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def setup_executor(max_workers: Optional[int] = None):
+    """Создаёт пул потоков для CPU-тяжёлых операций (по умолчанию — до 4 потоков)."""
+    global _executor
+    shutdown_executor()
+    _executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1),
+                                   thread_name_prefix="excel")
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполняет func в пуле и ждёт результат, не блокируя event loop."""
+    if _executor is None:
+        setup_executor()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+async def iterate_blocking(iterator: Iterator[T]) -> AsyncIterator[T]:
+    """Шагает синхронный генератор в пуле и отдаёт элементы по мере готовности."""
+    sentinel = object()
+    while True:
+        item = await run_blocking(next, iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
@@ -0,0 +1,205 @@
+# utils/fake_bot_api.py
+"""Локальная заглушка Telegram Bot API для нагрузочных прогонов без настоящего Telegram.
+
+Понимает getUpdates (long polling), sendMessage, sendDocument, getFile и скачивание файлов;
+остальные методы отвечают успехом. Можно задать задержку ответа и долю ответов 429.
+Бот подключается к ней через TELEGRAM_API_URL:
+
+    python -m utils.fake_bot_api --port 8081 --latency 0.05 --rate-limit 0.01
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+# Ответ getMe: бот-заглушка
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Load Test Bot", "username": "load_test_bot"}
+# Дольше этого getUpdates не ждёт, даже если клиент попросил больший timeout
+MAX_POLL_TIMEOUT = 50
+# Методы, к которым применяются задержка и 429; getUpdates и служебные вызовы отвечают сразу
+DELAYED_METHODS = ("sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup",
+                   "answerCallbackQuery", "getFile")
+
+
+class FakeBotAPI:
+    """aiohttp-сервер с минимальным Bot API: апдейты кладёт нагрузочный драйвер через push_update."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.rate_limited = 0
+        self.documents_received = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._updates: List[dict] = []
+        self._new_update = asyncio.Event()
+        # file_id -> (путь для скачивания, содержимое)
+        self._files: Dict[str, Tuple[str, bytes]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_post("/bot{token}/{method}", self._handle_method)
+        self.app.router.add_get("/bot{token}/{method}", self._handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+
+    # === Управление из драйвера ===
+
+    def push_update(self, update: dict) -> int:
+        """Ставит апдейт в очередь getUpdates, проставляя update_id; возвращает его."""
+        update_id = next(self._update_ids)
+        self._updates.append({**update, "update_id": update_id})
+        self._new_update.set()
+        return update_id
+
+    def add_file(self, content: bytes, file_name: str = "file.bin") -> str:
+        """Регистрирует файл, который бот сможет получить через getFile; возвращает file_id."""
+        file_id = f"file{next(self._file_ids)}"
+        self._files[file_id] = (f"documents/{file_id}/{file_name}", content)
+        return file_id
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "rate_limited": self.rate_limited,
+            "documents_received": self.documents_received,
+            "bytes_received": self.bytes_received,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает базовый адрес для TelegramAPIServer.from_base."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # === Обработчики HTTP ===
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id, **fields) -> dict:
+        return {
+            "message_id": self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    async def _get_updates(self, params) -> web.Response:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = min(float(params.get("timeout") or 0), MAX_POLL_TIMEOUT)
+        # offset подтверждает всё, что раньше него, как в настоящем API
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._ok(self._updates[:limit])
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await request.post() if request.body_exists else request.query
+        if method == "getUpdates":
+            return await self._get_updates(params)
+
+        if method in DELAYED_METHODS:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            if delay:
+                await asyncio.sleep(delay)
+            if self.rate_limit and self._random.random() < self.rate_limit:
+                self.rate_limited += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+
+        if method == "getMe":
+            return self._ok(BOT_USER)
+        if method in ("sendMessage", "editMessageText"):
+            return self._ok(self._message(params["chat_id"], text=params.get("text", "")))
+        if method == "sendDocument":
+            document = params.get("document")
+            # aiogram кладёт файл в отдельное поле и ссылается на него как attach://<поле>
+            if isinstance(document, str) and document.startswith("attach://"):
+                document = params.get(document[len("attach://"):])
+            content = document.file.read() if isinstance(document, web.FileField) else b""
+            file_name = document.filename if isinstance(document, web.FileField) else "document"
+            self.documents_received += 1
+            self.bytes_received += len(content)
+            file_id = self.add_file(content, file_name)
+            return self._ok(self._message(params["chat_id"], document={
+                "file_id": file_id, "file_unique_id": file_id, "file_name": file_name, "file_size": len(content),
+            }))
+        if method == "getFile":
+            file_id = params.get("file_id")
+            if file_id not in self._files:
+                return web.json_response(
+                    {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}, status=400
+                )
+            path, content = self._files[file_id]
+            return self._ok({"file_id": file_id, "file_unique_id": file_id, "file_size": len(content), "file_path": path})
+        return self._ok(True)
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        # Путь вида documents/<file_id>/<имя>
+        parts = request.match_info["path"].split("/")
+        if len(parts) < 2 or parts[1] not in self._files:
+            raise web.HTTPNotFound()
+        return web.Response(body=self._files[parts[1]][1])
+
+
+async def _serve(args):
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_limit, args.retry_after)
+    url = await api.start(args.host, args.port)
+    print(f"🧪 Заглушка Bot API слушает {url} (TELEGRAM_API_URL={url})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(json.dumps(api.stats(), ensure_ascii=False))
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа на отправку, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, до N сек")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429, 0..1")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, сек")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
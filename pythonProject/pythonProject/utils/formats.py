@@ -0,0 +1,147 @@
+# utils/formats.py
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from typing import Dict, Iterator, List
+
+from utils.excel import (
+    EXPORT_HEADERS,
+    IMPORT_COLUMNS,
+    PARSE_CHUNK_SIZE,
+    ExcelExportWriter,
+    iter_excel_chunks,
+    iter_row_chunks,
+)
+
+
+# ======================
+# ЭКСПОРТ: CSV, CSV.GZ, JSONL
+# ======================
+
+def _temp_path(suffix: str) -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        return tmp.name
+
+
+class CsvExportWriter:
+    """Пишет выгрузку в CSV (или CSV.GZ) построчно, с теми же колонками, что и xlsx."""
+
+    def __init__(self, compress: bool = False):
+        self.extension = "csv.gz" if compress else "csv"
+        self.path = _temp_path("." + self.extension)
+        # utf-8-sig: Excel без BOM показывает кириллицу кракозябрами
+        if compress:
+            self._file = gzip.open(self.path, "wt", encoding="utf-8-sig", newline="", compresslevel=6)
+        else:
+            self._file = open(self.path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EXPORT_HEADERS)
+        self.rows = 0
+
+    def append(self, tasks):
+        self._writer.writerows([task[column] for column in EXPORT_HEADERS] for task in tasks)
+        self.rows += len(tasks)
+
+    def save(self) -> str:
+        self._file.close()
+        return self.path
+
+    def discard(self):
+        """Закрывает и удаляет недописанный файл."""
+        self._file.close()
+        os.remove(self.path)
+
+
+class JsonlExportWriter:
+    """Пишет выгрузку в JSON Lines: один объект задачи на строку."""
+
+    extension = "jsonl"
+
+    def __init__(self):
+        self.path = _temp_path(".jsonl")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self.rows = 0
+
+    def append(self, tasks):
+        for task in tasks:
+            self._file.write(json.dumps({column: task[column] for column in EXPORT_HEADERS}, ensure_ascii=False))
+            self._file.write("\n")
+            self.rows += 1
+
+    def save(self) -> str:
+        self._file.close()
+        return self.path
+
+    def discard(self):
+        """Закрывает и удаляет недописанный файл."""
+        self._file.close()
+        os.remove(self.path)
+
+
+# Формат -> (подпись кнопки, фабрика писателя)
+EXPORT_FORMATS = {
+    "xlsx": ("📊 Excel (.xlsx)", ExcelExportWriter),
+    "csv": ("📄 CSV", CsvExportWriter),
+    "csv.gz": ("🗜 CSV (gzip)", lambda: CsvExportWriter(compress=True)),
+    "jsonl": ("🧾 JSON Lines", JsonlExportWriter),
+}
+
+
+def create_export_writer(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    return EXPORT_FORMATS[fmt][1]()
+
+
+# ======================
+# ИМПОРТ: те же форматы обратно
+# ======================
+
+IMPORT_SUFFIXES = (".xlsx", ".csv", ".csv.gz", ".jsonl")
+
+
+def _iter_csv_chunks(text_stream, chunk_size: int) -> Iterator[List[Dict]]:
+    rows = csv.reader(text_stream)
+    header = next(rows, None)
+    if header is None:
+        return
+    yield from iter_row_chunks(header, rows, chunk_size)
+
+
+def _iter_jsonl_chunks(text_stream, chunk_size: int) -> Iterator[List[Dict]]:
+    # Ключи объекта сопоставляются с колонками импорта; лишние поля игнорируются
+    rows = (
+        tuple(record.get(column) for column in IMPORT_COLUMNS)
+        for record in (json.loads(line) for line in text_stream if line.strip())
+    )
+    yield from iter_row_chunks(IMPORT_COLUMNS, rows, chunk_size)
+
+
+def _open_text(source, encoding: str):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, encoding=encoding, newline="")
+    return io.TextIOWrapper(source, encoding=encoding, newline="")
+
+
+def iter_task_chunks(source, filename: str, chunk_size: int = PARSE_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """Выбирает разборщик по расширению файла; source — путь или бинарный поток."""
+    name = filename.lower()
+    if name.endswith(".xlsx"):
+        yield from iter_excel_chunks(source, chunk_size)
+        return
+    if name.endswith(".csv.gz"):
+        stream = gzip.open(source, "rt", encoding="utf-8-sig", newline="")
+    elif name.endswith(".csv"):
+        stream = _open_text(source, "utf-8-sig")
+    elif name.endswith(".jsonl"):
+        stream = _open_text(source, "utf-8")
+    else:
+        raise ValueError(f"Поддерживаются файлы: {', '.join(IMPORT_SUFFIXES)}")
+    with stream:
+        if name.endswith(".jsonl"):
+            yield from _iter_jsonl_chunks(stream, chunk_size)
+        else:
+            yield from _iter_csv_chunks(stream, chunk_size)
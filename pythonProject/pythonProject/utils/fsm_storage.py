@@ -0,0 +1,117 @@
+# utils/fsm_storage.py
+import json
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from database import connection
+
+# Брошенный на полпути диалог (например, подтверждение очистки БД) через сутки забывается
+FSM_STATE_TTL = 24 * 60 * 60
+
+_UPSERT_STATE = """
+    INSERT INTO fsm_state (key, state, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+"""
+_UPSERT_DATA = """
+    INSERT INTO fsm_state (key, data, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+"""
+_SELECT = "SELECT state, data, updated_at FROM fsm_state WHERE key = ?"
+# Пустую запись (нет ни состояния, ни данных) не храним
+_DELETE_EMPTY = "DELETE FROM fsm_state WHERE key = ? AND state IS NULL AND data = '{}'"
+
+
+def _dump(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_state базы tasks.db.
+
+    Данные сериализуются в JSON, поэтому в state кладутся только простые значения
+    (id, строки, числа), а не строки БД. Записи старше ttl считаются пустыми.
+    """
+
+    def __init__(self, ttl: Optional[float] = FSM_STATE_TTL, key_builder: Optional[KeyBuilder] = None):
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder()
+
+    def _fresh(self, row) -> bool:
+        return row is not None and (self.ttl is None or row["updated_at"] >= time.time() - self.ttl)
+
+    async def _drop_expired(self, db, key: str):
+        # Просроченное состояние не должно «ожить» вместе с новой записью
+        if self.ttl is not None:
+            await db.execute("DELETE FROM fsm_state WHERE key = ? AND updated_at < ?", (key, time.time() - self.ttl))
+
+    async def _load(self, db, key: str):
+        async with db.execute(_SELECT, (key,)) as cursor:
+            row = await cursor.fetchone()
+        return row if self._fresh(row) else None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        storage_key = self.key_builder.build(key)
+        async with connection() as db:
+            await self._drop_expired(db, storage_key)
+            await db.execute(_UPSERT_STATE, (storage_key, value, time.time()))
+            await db.execute(_DELETE_EMPTY, (storage_key,))
+            await db.commit()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with connection() as db:
+            row = await self._load(db, self.key_builder.build(key))
+        return row["state"] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        async with connection() as db:
+            await self._drop_expired(db, storage_key)
+            await db.execute(_UPSERT_DATA, (storage_key, _dump(data), time.time()))
+            await db.execute(_DELETE_EMPTY, (storage_key,))
+            await db.commit()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with connection() as db:
+            row = await self._load(db, self.key_builder.build(key))
+        return json.loads(row["data"]) if row else {}
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Чтение и запись в одной транзакции: два апдейта одного чата не затрут друг друга
+        storage_key = self.key_builder.build(key)
+        async with connection() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            row = await self._load(db, storage_key)
+            current = json.loads(row["data"]) if row else {}
+            current.update(data)
+            await self._drop_expired(db, storage_key)
+            await db.execute(_UPSERT_DATA, (storage_key, _dump(current), time.time()))
+            await db.execute(_DELETE_EMPTY, (storage_key,))
+            await db.commit()
+        return current.copy()
+
+    async def purge_expired(self) -> int:
+        """Удаляет просроченные записи; возвращает их число."""
+        if self.ttl is None:
+            return 0
+        async with connection() as db:
+            cursor = await db.execute("DELETE FROM fsm_state WHERE updated_at < ?", (time.time() - self.ttl,))
+            await db.commit()
+            return cursor.rowcount
+
+    async def count_states(self) -> Dict[str, int]:
+        """Число незавершённых диалогов по состояниям (без просроченных) — для метрик."""
+        since = time.time() - self.ttl if self.ttl is not None else 0
+        async with connection() as db:
+            async with db.execute(
+                "SELECT state, count(*) AS n FROM fsm_state WHERE state IS NOT NULL AND updated_at >= ? GROUP BY state",
+                (since,)
+            ) as cursor:
+                return {row["state"]: row["n"] for row in await cursor.fetchall()}
+
+    async def close(self) -> None:
+        # Соединениями владеет пул database.py, он закрывается в close_db()
+        pass
@@ -0,0 +1,247 @@
+# utils/metrics.py
+"""Метрики процесса бота в текстовом формате Prometheus.
+
+Счётчики, гистограммы и gauge живут в памяти процесса; /metrics отдаёт их
+встроенным aiohttp-сервером (METRICS_PORT в .env). Внешних зависимостей нет.
+"""
+import functools
+import inspect
+import math
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from aiohttp import web
+
+# Границы бакетов по умолчанию, сек: от быстрых ответов из кэша до выгрузок на десятки секунд
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Для отдельных вызовов database.py: большинство укладывается в миллисекунды
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {_escape(self.documentation)}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self._samples())
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Счётчик не может уменьшаться")
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Текущее значение; replace() заменяет весь набор разом, чтобы исчезнувшие метки не залипали."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def replace(self, values: Dict[Tuple, float]):
+        self._values = {tuple(str(part) for part in key): value for key, value in values.items()}
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Распределение длительностей по бакетам, плюс сумма и число наблюдений."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # метки -> (счётчики по бакетам, сумма, число)
+        self._values: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса и сборщиков, которые обновляют gauge перед каждой отдачей."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]):
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                print(f"Ошибка сборщика метрик {getattr(collector, '__name__', collector)}: {e}")
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+REGISTRY = Registry()
+
+HANDLER_DURATION = REGISTRY.register(Histogram(
+    "bot_handler_duration_seconds", "Время обработки апдейта, по хендлерам", ("update", "handler")
+))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "bot_handler_errors_total", "Апдейты, обработка которых закончилась исключением", ("update", "handler")
+))
+DB_DURATION = REGISTRY.register(Histogram(
+    "bot_db_call_duration_seconds", "Время вызова функций database.py", ("function",), DB_BUCKETS
+))
+REMINDERS = REGISTRY.register(Counter(
+    "bot_reminders_total", "Сообщения с напоминаниями: sent, failed, retried", ("result",)
+))
+IMPORT_ROWS = REGISTRY.register(Counter(
+    "bot_import_rows_total", "Задачи, добавленные загрузкой файлов"
+))
+IMPORT_DURATION = REGISTRY.register(Histogram(
+    "bot_import_duration_seconds", "Время загрузки файла с задачами, от скачивания до записи в БД"
+))
+EXPORT_ROWS = REGISTRY.register(Counter(
+    "bot_export_rows_total", "Задачи, попавшие в выгрузки", ("format",)
+))
+EXPORT_DURATION = REGISTRY.register(Histogram(
+    "bot_export_duration_seconds", "Время подготовки файла выгрузки", ("format",)
+))
+FSM_STATES = REGISTRY.register(Gauge(
+    "bot_fsm_states", "Незавершённые диалоги FSM по состояниям", ("state",)
+))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "bot_startup_seconds", "Этапы запуска: секунды от начала main.py до отметки", ("stage",)
+))
+
+
+def timed_db(func):
+    """Пишет время вызова в bot_db_call_duration_seconds{function=<имя>}.
+
+    Для асинхронных генераторов меряется весь обход, от первой пачки до последней.
+    """
+    name = func.__name__
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def generator_wrapper(*args, **kwargs):
+            with DB_DURATION.time(function=name):
+                async for item in func(*args, **kwargs):
+                    yield item
+        return generator_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with DB_DURATION.time(function=name):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def build_metrics_app(registry: Registry = REGISTRY) -> web.Application:
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=(await registry.render()).encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+async def start_metrics_server(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    """Запускает HTTP-сервер с /metrics; остановка — await runner.cleanup()."""
+    runner = web.AppRunner(build_metrics_app(registry), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📊 Метрики: http://{host}:{port}/metrics")
+    return runner
+
@@ -0,0 +1,63 @@
+# utils/middlewares.py
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from database import get_user_by_tg_id
+from utils.metrics import HANDLER_DURATION, HANDLER_ERRORS
+
+
+class UserMiddleware(BaseMiddleware):
+    """Один раз на апдейт загружает запись пользователя и передаёт её хендлерам аргументом user."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        data["user"] = await get_user_by_tg_id(from_user.id) if from_user else None
+        return await handler(event, data)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время обработки апдейта в bot_handler_duration_seconds.
+
+    Снаружи (dp.update) засекает время всего апдейта, включая остальные middleware.
+    Какой хендлер сработал, видно только внутри роутеров, поэтому тот же объект стоит
+    и внутренним middleware на сообщениях и колбэках: он подписывает замер именем хендлера.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            labels = data.get("metrics_labels")
+            if labels is not None and "handler" in data:
+                labels["handler"] = data["handler"].callback.__name__
+            return await handler(event, data)
+
+        labels = {"update": event.event_type, "handler": "unhandled"}
+        data["metrics_labels"] = labels
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(**labels)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, **labels)
+
+
+def setup_metrics_middleware(dp: Dispatcher):
+    """Вешает MetricsMiddleware первым снаружи и внутрь сообщений и колбэков."""
+    middleware = MetricsMiddleware()
+    dp.update.outer_middleware(middleware)
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
@@ -0,0 +1,130 @@
+# utils/outbox.py
+import asyncio
+import json
+from typing import Callable, List
+
+from database import connection, DUE_REMINDERS_QUERY, DUE_DIGEST_QUERY
+from utils.delivery import DeliveryEngine, DeliveryReport, Outgoing
+from utils.metrics import REMINDERS, timed_db
+
+# Сколько сообщений отправляется между фиксациями состояния в БД
+OUTBOX_BATCH = 10
+# После стольких неудачных попыток сообщение помечается как failed
+OUTBOX_MAX_ATTEMPTS = 5
+# Сколько дней хранить отправленные и проваленные записи
+OUTBOX_RETENTION_DAYS = 30
+
+# Две доставки одновременно подобрали бы одни и те же «зависшие» записи
+_deliver_lock = asyncio.Lock()
+
+
+@timed_db
+async def enqueue_due_reminders(now_str: str, next_str: str, digest: bool,
+                                build_messages: Callable[[list], List[Outgoing]]) -> int:
+    """Ставит наступившие напоминания в reminder_outbox и переносит next_reminder — в одной транзакции.
+
+    build_messages получает строки DUE_*_QUERY и возвращает сообщения, у которых key —
+    список пар (task_id, slot). Возвращает число поставленных в очередь сообщений.
+    """
+    async with connection() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        async with db.execute(DUE_DIGEST_QUERY if digest else DUE_REMINDERS_QUERY, (now_str,)) as cursor:
+            rows = await cursor.fetchall()
+        messages = build_messages(rows)
+        items = []
+        for message in messages:
+            cursor = await db.execute(
+                "INSERT INTO reminder_outbox (chat_id, text) VALUES (?, ?)",
+                (message.chat_id, message.text)
+            )
+            items.extend((task_id, slot, cursor.lastrowid) for task_id, slot in message.key)
+        await db.executemany(
+            "INSERT INTO reminder_outbox_items (task_id, slot, outbox_id) VALUES (?, ?, ?)",
+            items
+        )
+        await db.execute(
+            "UPDATE tasks SET next_reminder = ? WHERE id IN (SELECT value FROM json_each(?))",
+            (next_str, json.dumps([task_id for task_id, _, _ in items]))
+        )
+        await db.execute(
+            "DELETE FROM reminder_outbox WHERE state IN ('sent', 'failed') AND updated_at < datetime('now', ?)",
+            (f"-{OUTBOX_RETENTION_DAYS} days",)
+        )
+        await db.commit()
+    return len(messages)
+
+
+@timed_db
+async def has_pending_outbox() -> bool:
+    async with connection() as db:
+        async with db.execute("SELECT 1 FROM reminder_outbox WHERE state = 'pending' LIMIT 1") as cursor:
+            return await cursor.fetchone() is not None
+
+
+async def _mark_sent(message: Outgoing):
+    # Фиксируем сразу после отправки: после падения повторно уйдут только сообщения «в полёте»
+    async with connection() as db:
+        await db.execute(
+            "UPDATE reminder_outbox SET state = 'sent', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (message.key,)
+        )
+        await db.commit()
+
+
+async def deliver_outbox(bot, batch_size: int = OUTBOX_BATCH) -> DeliveryReport:
+    """Отправляет ожидающие сообщения очереди небольшими пачками.
+
+    Пачка помечается 'sending' до отправки, каждое доставленное сообщение — 'sent' сразу после неё,
+    неудачные возвращаются в 'pending' в конце пачки. После перезапуска работа продолжается
+    с первой неотправленной записи; повторно могут уйти лишь сообщения, отправленные
+    в последние миллисекунды перед падением, отметка о которых не успела записаться.
+    """
+    total = DeliveryReport()
+    async with _deliver_lock:
+        async with connection() as db:
+            # Записи в 'sending' остались от упавшего процесса
+            await db.execute("UPDATE reminder_outbox SET state = 'pending' WHERE state = 'sending'")
+            await db.commit()
+
+        engine = DeliveryEngine(bot)
+        last_id = 0
+        while True:
+            async with connection() as db:
+                async with db.execute(
+                    "SELECT id, chat_id, text FROM reminder_outbox WHERE state = 'pending' AND id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                if not rows:
+                    break
+                ids = [row["id"] for row in rows]
+                await db.execute(
+                    "UPDATE reminder_outbox SET state = 'sending', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP "
+                    "WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(ids),)
+                )
+                await db.commit()
+            last_id = ids[-1]
+
+            report = await engine.deliver(
+                (Outgoing(chat_id=row["chat_id"], text=row["text"], key=row["id"]) for row in rows),
+                on_delivered=_mark_sent
+            )
+            delivered = set(report.delivered)
+            failed = [outbox_id for outbox_id in ids if outbox_id not in delivered]
+            async with connection() as db:
+                await db.execute(
+                    "UPDATE reminder_outbox SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "updated_at = CURRENT_TIMESTAMP WHERE id IN (SELECT value FROM json_each(?))",
+                    (OUTBOX_MAX_ATTEMPTS, json.dumps(failed))
+                )
+                await db.commit()
+
+            REMINDERS.inc(report.sent, result="sent")
+            REMINDERS.inc(report.failed, result="failed")
+            REMINDERS.inc(report.retried, result="retried")
+            total.sent += report.sent
+            total.retried += report.retried
+            total.failed += report.failed
+            total.delivered.extend(report.delivered)
+    return total
@@ -0,0 +1,209 @@
+# utils/querylog.py
+"""Журнал SQL-запросов: время и число строк каждого выражения, медленные — с планом запроса.
+
+Соединения пула database.py оборачиваются в InstrumentedConnection, поэтому учитывается
+всё, что идёт через connection(): database.py, outbox, планировщик, хранилище FSM.
+Время выражения — выполнение плюс выборка строк из курсора; паузы вызывающего кода
+между fetch* в него не входят.
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Порог медленного запроса, сек (None — не писать в лог, только копить статистику)
+SLOW_QUERY_THRESHOLD = 0.1
+TOP_SIZE = 10
+# Разных текстов запросов в памяти не больше этого: IN (?, ?, …) разной длины дают новые тексты
+MAX_STATEMENTS = 500
+# Для этих выражений EXPLAIN QUERY PLAN что-то показывает; BEGIN, PRAGMA и DDL пропускаем
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+@dataclass
+class StatementStats:
+    sql: str
+    calls: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    rows: int = 0
+    slow: int = 0
+    # План последнего медленного выполнения
+    plan: Optional[List[str]] = None
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class QueryLog:
+    """Сводка по выражениям в памяти процесса и лог медленных с EXPLAIN QUERY PLAN."""
+
+    def __init__(self, threshold: Optional[float] = SLOW_QUERY_THRESHOLD, max_statements: int = MAX_STATEMENTS):
+        self.threshold = threshold
+        self.max_statements = max_statements
+        self._stats: Dict[str, StatementStats] = {}
+
+    def wrap(self, db) -> "InstrumentedConnection":
+        return InstrumentedConnection(db, self)
+
+    async def record(self, db, sql: str, parameters, duration: float, rows: int):
+        """Учитывает одно выполнение; db — исходное соединение aiosqlite (для EXPLAIN)."""
+        key = normalize_sql(sql)
+        stats = self._stats.get(key)
+        if stats is None:
+            if len(self._stats) >= self.max_statements:
+                # Вытесняем самое лёгкое: в сводке нужны тяжёлые
+                del self._stats[min(self._stats.values(), key=lambda item: item.total).sql]
+            stats = self._stats[key] = StatementStats(key)
+        stats.calls += 1
+        stats.total += duration
+        stats.max = max(stats.max, duration)
+        stats.rows += rows
+        if self.threshold is not None and duration >= self.threshold:
+            stats.slow += 1
+            stats.plan = await self._explain(db, sql, parameters)
+            plan = "; ".join(stats.plan) if stats.plan else "—"
+            print(f"🐢 Медленный запрос: {duration * 1000:.1f} мс, строк {rows}: {key}\n   План: {plan}")
+
+    @staticmethod
+    async def _explain(db, sql: str, parameters) -> List[str]:
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        try:
+            async with db.execute("EXPLAIN QUERY PLAN " + sql, parameters or ()) as cursor:
+                return [row[3] for row in await cursor.fetchall()]
+        except Exception as e:
+            # Например, временная таблица импорта уже удалена
+            return [f"план недоступен: {e}"]
+
+    def top(self, n: int = TOP_SIZE) -> List[StatementStats]:
+        """Самые тяжёлые выражения по суммарному времени."""
+        return sorted(self._stats.values(), key=lambda item: item.total, reverse=True)[:n]
+
+    def reset(self):
+        self._stats.clear()
+
+
+class _Execution:
+    """Как aiosqlite.context.Result: результат execute можно и await, и async with (закроет курсор)."""
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._cursor = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._cursor = await self._coro
+        return self._cursor
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._cursor.close()
+
+
+class TimedCursor:
+    """Курсор SELECT: копит время выборки и число строк, в журнал попадает, когда выборка закончена."""
+
+    def __init__(self, cursor, connection: "InstrumentedConnection", sql: str, parameters, elapsed: float):
+        self._cursor = cursor
+        self._connection = connection
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = elapsed
+        self._rows = 0
+        self._finished = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        row = await self._cursor.fetchone()
+        self._elapsed += time.perf_counter() - started
+        if row is None:
+            await self.finish()
+        else:
+            self._rows += 1
+        return row
+
+    async def fetchmany(self, size: Optional[int] = None):
+        started = time.perf_counter()
+        rows = await (self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany())
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        if not rows:
+            await self.finish()
+        return rows
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await self._cursor.fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        await self.finish()
+        return rows
+
+    async def close(self):
+        await self.finish()
+        await self._cursor.close()
+
+    async def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        self._connection.pending.discard(self)
+        await self._connection.log.record(
+            self._connection.db, self._sql, self._parameters, self._elapsed, self._rows
+        )
+
+
+class InstrumentedConnection:
+    """Обёртка соединения aiosqlite: execute/executemany меряются, остальное — как у соединения."""
+
+    def __init__(self, db, log: QueryLog):
+        self.db = db
+        self.log = log
+        # Курсоры SELECT, выборку из которых ещё не закончили
+        self.pending = set()
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def execute(self, sql: str, parameters=None) -> _Execution:
+        return _Execution(self._execute(sql, parameters))
+
+    async def _execute(self, sql: str, parameters):
+        started = time.perf_counter()
+        cursor = await self.db.execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        if cursor.description is None:
+            # Строк не возвращает: выражение уже выполнено целиком
+            await self.log.record(self.db, sql, parameters, elapsed, max(cursor.rowcount, 0))
+            return cursor
+        timed = TimedCursor(cursor, self, sql, parameters, elapsed)
+        self.pending.add(timed)
+        return timed
+
+    def executemany(self, sql: str, parameters) -> _Execution:
+        return _Execution(self._executemany(sql, parameters))
+
+    async def _executemany(self, sql: str, parameters):
+        parameters = list(parameters)
+        started = time.perf_counter()
+        cursor = await self.db.executemany(sql, parameters)
+        elapsed = time.perf_counter() - started
+        await self.log.record(self.db, sql, parameters[0] if parameters else None, elapsed, max(cursor.rowcount, 0))
+        return cursor
+
+    async def finish_pending(self):
+        """Дописывает в журнал курсоры, которые вызывающий код не дочитал и не закрыл."""
+        for cursor in list(self.pending):
+            await cursor.finish()
+
+
+QUERY_LOG = QueryLog()
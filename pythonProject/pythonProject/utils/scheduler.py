@@ -1,43 +1,191 @@
 from apscheduler.triggers.cron import CronTrigger
-from database import DB_PATH
-import aiosqlite
+from database import get_next_due_reminder, on_reminder_scheduled
+from utils.delivery import DeliveryReport, Outgoing
+from utils.outbox import enqueue_due_reminders, deliver_outbox, has_pending_outbox
 from datetime import datetime, timedelta
+from functools import partial
+from html import escape
+from typing import List, Optional
+import asyncio
+import json
 
-async def send_reminders(bot):
+REMINDER_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Через сколько повторить сообщения outbox, которые не удалось доставить
+RETRY_INTERVAL = timedelta(minutes=15)
+# Верхняя граница сна будильника, сек
+MAX_SLEEP = 60.0
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Слишком длинные описания в сводке обрезаются, чтобы одна задача всегда помещалась
+DIGEST_LINE_LIMIT = 500
+
+def _reminder_text(desc, end_date) -> str:
+    return (
+        f"🔔 <b>Напоминание о практике</b>\n\n"
+        f"Описание: {desc}\n"
+        f"Срок: {end_date}\n\n"
+        f"Напоминание повторяется еженедельно, пока задача не будет отмечена как «готово»."
+    )
+
+def _digest_messages(tg_id: int, tasks: List[dict]) -> List[Outgoing]:
+    """Собирает сводку по задачам преподавателя, деля её на части не длиннее лимита Telegram."""
+    header = "🔔 <b>Напоминание о практиках</b>\n\n"
+    footer = "\n\nНапоминания повторяются еженедельно, пока задачи не будут отмечены как «готово»."
+    budget = TELEGRAM_MESSAGE_LIMIT - len(header) - len(footer)
+    messages = []
+    lines, slots, size = [], [], 0
+    for task in tasks:
+        description = task["description"]
+        if len(description) > DIGEST_LINE_LIMIT:
+            description = description[:DIGEST_LINE_LIMIT] + "…"
+        line = f"• {escape(description)} — до {task['end_date']}"
+        if lines and size + len(line) + 1 > budget:
+            messages.append(Outgoing(chat_id=tg_id, text=header + "\n".join(lines) + footer, key=slots))
+            lines, slots, size = [], [], 0
+        lines.append(line)
+        slots.append((task["id"], task["slot"]))
+        size += len(line) + 1
+    if lines:
+        messages.append(Outgoing(chat_id=tg_id, text=header + "\n".join(lines) + footer, key=slots))
+    return messages
+
+def _build_messages(rows, digest: bool) -> List[Outgoing]:
+    """Строки DUE_*_QUERY -> сообщения; key каждого — пары (task_id, слот напоминания)."""
+    if digest:
+        return [
+            message
+            for tg_id, tasks in rows
+            for message in _digest_messages(tg_id, json.loads(tasks))
+        ]
+    return [
+        Outgoing(chat_id=tg_id, text=_reminder_text(desc, end_date), key=[(task_id, slot)])
+        for task_id, desc, end_date, status, tg_id, slot in rows
+    ]
+
+async def send_reminders(bot, digest: bool = True) -> DeliveryReport:
+    """Рассылает напоминания: digest=True — одно сообщение на преподавателя, иначе по задаче.
+
+    Сначала наступившие напоминания атомарно переносятся в reminder_outbox, затем очередь
+    доставляется (см. deliver_outbox): после падения процесса ничего не теряется,
+    а уже отмеченные отправленными сообщения не уходят повторно.
+    """
     now = datetime.now()
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute('''
-            SELECT t.id, t.description, t.end_date, t.status, u.tg_user_id
-            FROM tasks t
-            JOIN users u ON t.user_id = u.id
-            WHERE t.next_reminder <= ? AND t.status != 'готово'
-        ''', (now.strftime("%Y-%m-%d %H:%M:%S"),)) as cursor:
-            rows = await cursor.fetchall()
-        for row in rows:
-            task_id, desc, end_date, status, tg_id = row
+    queued = await enqueue_due_reminders(
+        now.strftime(REMINDER_FORMAT),
+        (now + timedelta(weeks=1)).strftime(REMINDER_FORMAT),
+        digest,
+        partial(_build_messages, digest=digest)
+    )
+    report = await deliver_outbox(bot)
+    report.queued = queued
+    print(f"🔔 Напоминания: отправлено {report.sent}, повторов {report.retried}, ошибок {report.failed}")
+    return report
+
+def _parse_reminder(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:19], REMINDER_FORMAT)
+    except ValueError:
+        return None
+
+class ReminderScheduler:
+    """Будильник на ближайший next_reminder вместо ежедневного прохода в 9:00.
+
+    Ближайшее время берётся из индекса (get_next_due_reminder), между срабатываниями
+    держится в памяти. Запись более раннего напоминания через database будит цикл сразу.
+    """
+
+    def __init__(self, bot, digest: bool = True, retry_interval: timedelta = RETRY_INTERVAL,
+                 max_sleep: float = MAX_SLEEP):
+        self.bot = bot
+        self.digest = digest
+        self.retry_interval = retry_interval
+        self.max_sleep = max_sleep
+        self.next_due: Optional[datetime] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Когда повторить доставку недоставленного из outbox; при старте — сразу
+        self._retry_at: Optional[datetime] = datetime.now()
+
+    def notify(self, reminder_dt: str):
+        due = _parse_reminder(reminder_dt)
+        if due is None or self.next_due is None or due < self.next_due:
+            self._wake.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
             try:
-                await bot.send_message(
-                    tg_id,
-                    f"🔔 <b>Напоминание о практике</b>\\n\\n"
-                    f"Описание: {desc}\\n"
-                    f"Срок: {end_date}\\n\\n"
-                    f"Напоминание повторяется еженедельно, пока задача не будет отмечена как «готово».",
-                    parse_mode="HTML"
-                )
-                next_rem = now + timedelta(weeks=1)
-                await db.execute(
-                    "UPDATE tasks SET next_reminder = ? WHERE id = ?",
-                    (next_rem.strftime("%Y-%m-%d %H:%M:%S"), task_id)
-                )
+                await self._tick()
             except Exception as e:
-                print(f"Не удалось отправить напоминание пользователю {tg_id}: {e}")
-        await db.commit()
+                # Например, tasks.db занята другим процессом: будильник не должен умирать молча
+                print(f"Ошибка будильника напоминаний: {e}")
+                if self._retry_at is None:
+                    # Недоставленное могло остаться в outbox, а проверить это не удалось
+                    self._retry_at = datetime.now() + self.retry_interval
+                await asyncio.sleep(self.max_sleep)
+
+    async def _tick(self):
+        """Один проход: рассылка, если срок наступил, иначе сон до ближайшего срока."""
+        self._wake.clear()
+        now = datetime.now()
+        due = _parse_reminder(await get_next_due_reminder())
+        retry_due = self._retry_at is not None and now >= self._retry_at
+        if (due is not None and due <= now) or retry_due:
+            self._retry_at = None
+            idle = False
+            try:
+                report = await send_reminders(self.bot, self.digest)
+                # Наступивший срок ничего не поставил в очередь: не крутим цикл вхолостую
+                idle = report.queued == 0 and not retry_due
+            except Exception as e:
+                print(f"Ошибка рассылки напоминаний: {e}")
+                idle = True
+            if await has_pending_outbox():
+                self._retry_at = now + self.retry_interval
+            if idle:
+                await self._sleep(self.max_sleep)
+            return
+        self.next_due = min((t for t in (due, self._retry_at) if t is not None), default=None)
+        # Сон ограничен сверху: запись в БД могла прийти не через этот процесс
+        timeout = self.max_sleep
+        if self.next_due is not None:
+            timeout = min(timeout, max(0.0, (self.next_due - datetime.now()).total_seconds()))
+        await self._sleep(timeout)
+
+    async def _sleep(self, timeout: float):
+        """Ждёт timeout секунд или записи более раннего напоминания (notify)."""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
-def setup_scheduler(scheduler, bot):
+def setup_scheduler(scheduler, bot, digest: bool = True, precise: bool = True) -> Optional[ReminderScheduler]:
+    """precise=True — будильник на точное время напоминания, иначе ежедневный проход в 9:00."""
+    if precise:
+        reminder_scheduler = ReminderScheduler(bot, digest)
+        on_reminder_scheduled(reminder_scheduler.notify)
+        reminder_scheduler.start()
+        return reminder_scheduler
     scheduler.add_job(
         send_reminders,
         CronTrigger(hour=9, minute=0),
-        args=[bot],
+        args=[bot, digest],
         id="daily_reminders",
         replace_existing=True
     )
+    # Дослать то, что осталось в очереди после прошлого запуска
+    scheduler.add_job(deliver_outbox, args=[bot], id="resume_outbox", replace_existing=True)
+    return None
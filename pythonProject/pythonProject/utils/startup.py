@@ -0,0 +1,136 @@
+# utils/startup.py
+"""Профиль запуска: этапы старта бота до первого обработанного апдейта и цена импортов.
+
+Этапы отмечаются всегда (это пара вызовов perf_counter) и попадают в метрику
+bot_startup_seconds. Разбивку импортов по пакетам собирает ImportTimer, он
+ставится только при STARTUP_PROFILE=1. Модуль импортируется в main.py раньше
+aiogram, поэтому сам тянет только стандартную библиотеку.
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from importlib.machinery import ExtensionFileLoader, SourceFileLoader, SourcelessFileLoader
+from typing import Dict, List, Optional, Tuple
+
+# Пакетов в разбивке импортов не больше этого
+IMPORT_TOP = 15
+# Загрузчики, которые создаются на каждый модуль: им можно подменить exec_module у экземпляра
+_TIMED_LOADERS = (SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader)
+
+
+class ImportTimer:
+    """Finder в начале sys.meta_path: находит spec остальными finder'ами и засекает exec_module.
+
+    Время модуля — его собственное, без вложенных импортов (как self в python -X importtime),
+    и копится по пакету верхнего уровня.
+    """
+
+    def __init__(self):
+        self.totals: Counter = Counter()
+        self.modules = 0
+        self._local = threading.local()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if isinstance(spec.loader, _TIMED_LOADERS):
+            spec.loader.exec_module = self._timed(name, spec.loader.exec_module)
+        return spec
+
+    def _timed(self, name: str, exec_module):
+        def exec_module_timed(module):
+            # У каждого потока свой стек: сюда вложенные импорты добавляют своё время
+            stack = self._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - started
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.totals[name.partition(".")[0]] += elapsed - nested
+                self.modules += 1
+
+        return exec_module_timed
+
+    def top(self, n: int = IMPORT_TOP) -> List[Tuple[str, float]]:
+        return self.totals.most_common(n)
+
+
+class StartupProfile:
+    """Отметки этапов запуска в секундах от начала main.py."""
+
+    def __init__(self, started: float, imports: bool = False, output: Optional[str] = None):
+        self.started = started
+        self.output = output
+        self.stages: Dict[str, float] = {}
+        self.import_timer: Optional[ImportTimer] = None
+        self._first_update = False
+        if imports:
+            self.import_timer = ImportTimer()
+            self.import_timer.install()
+
+    def mark(self, stage: str):
+        """Отмечает этап; повторная отметка того же этапа не перезаписывает первую."""
+        self.stages.setdefault(stage, time.perf_counter() - self.started)
+
+    async def first_update_middleware(self, handler, event, data):
+        """Внешний middleware dp.update: отмечает получение и обработку первого апдейта."""
+        if self._first_update:
+            return await handler(event, data)
+        self._first_update = True
+        self.mark("first_update")
+        try:
+            return await handler(event, data)
+        finally:
+            self.mark("first_update_handled")
+            self.finish()
+
+    def finish(self):
+        """Снимает ImportTimer, печатает отчёт и пишет JSON в output (только при STARTUP_PROFILE=1)."""
+        if self.import_timer is None:
+            return
+        self.import_timer.uninstall()
+        print(self.report())
+        if self.output:
+            with open(self.output, "w", encoding="utf-8") as f:
+                json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+
+    def as_dict(self) -> dict:
+        result = {"stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()}}
+        if self.import_timer is not None:
+            result["imports"] = {package: round(seconds, 4) for package, seconds in self.import_timer.top()}
+            result["imported_modules"] = self.import_timer.modules
+        return result
+
+    def report(self) -> str:
+        lines = ["⏱ Профиль запуска (сек от начала main.py):"]
+        previous = 0.0
+        for stage, seconds in self.stages.items():
+            lines.append(f"   {stage:<22} {seconds:8.3f}  (+{seconds - previous:.3f})")
+            previous = seconds
+        if self.import_timer is not None:
+            total = sum(self.import_timer.totals.values())
+            lines.append(f"📦 Импорты: {self.import_timer.modules} модулей, {total:.3f} с; самые тяжёлые пакеты:")
+            for package, seconds in self.import_timer.top():
+                lines.append(f"   {package:<22} {seconds:8.3f}")
+        return "\n".join(lines)
+
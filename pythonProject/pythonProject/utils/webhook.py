@@ -0,0 +1,46 @@
+# utils/webhook.py
+import asyncio
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, path: str, secret: str) -> web.Application:
+    """aiohttp-приложение с обработчиком aiogram на path; запросы без верного секрета получают 401."""
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, host: str, port: int, path: str, secret: str,
+                      public_url: Optional[str] = None):
+    """Принимает апдейты по HTTP до отмены задачи.
+
+    Если public_url задан, webhook регистрируется в Telegram. Без него сервер только слушает,
+    и апдейты можно прислать вручную, без доступа в интернет:
+
+        curl -X POST -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \\
+             -H "Content-Type: application/json" -d @update.json http://127.0.0.1:8080/webhook
+    """
+    app = build_webhook_app(dp, bot, path, secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        if public_url:
+            await bot.set_webhook(
+                public_url.rstrip("/") + path,
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        print(f"🌐 Webhook слушает http://{host}:{port}{path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        # Как и start_polling, по завершении закрываем HTTP-сессию бота
+        await bot.session.close()
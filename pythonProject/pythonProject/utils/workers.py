@@ -0,0 +1,224 @@
+# utils/workers.py
+import asyncio
+import multiprocessing
+import signal
+import threading
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Update
+
+from database import close_db, forget_cached_user, on_reminder_scheduled, on_user_changed, open_db
+from utils.executor import shutdown_executor
+from utils.metrics import start_metrics_server
+
+POLL_TIMEOUT = 30
+# Сколько ждать воркеры при остановке, прежде чем завершить их принудительно
+STOP_TIMEOUT = 10
+
+
+def _forward(source, loop: asyncio.AbstractEventLoop, target: asyncio.Queue):
+    """Перекладывает элементы из multiprocessing-очереди в asyncio-очередь до маркера None.
+
+    Работает в потоке-демоне: блокирующее чтение канала не должно держать завершение процесса.
+    """
+    while True:
+        item = source.get()
+        try:
+            loop.call_soon_threadsafe(target.put_nowait, item)
+        except RuntimeError:
+            return
+        if item is None:
+            return
+
+
+def _start_forwarding(source) -> asyncio.Queue:
+    target: asyncio.Queue = asyncio.Queue()
+    threading.Thread(target=_forward, args=(source, asyncio.get_running_loop(), target), daemon=True).start()
+    return target
+
+
+def route_key(update: Update) -> int:
+    """Ключ маршрутизации: чат (или пользователь), чтобы апдейты одного диалога шли по порядку в один воркер."""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat is not None:
+        return context.chat.id
+    if context.user is not None:
+        return context.user.id
+    return update.update_id
+
+
+# ======================
+# ВОРКЕР
+# ======================
+
+def _worker_main(index: int, create_bot: Callable[[], Bot], build_dispatcher: Callable[[Bot], Dispatcher],
+                 init: Optional[Callable[[], None]], updates, events, metrics: Optional[Tuple[str, int]] = None):
+    # Ctrl+C получает вся группа процессов; останавливает воркеров приёмник, маркером в очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker(index, create_bot, build_dispatcher, init, updates, events, metrics))
+
+
+async def _worker(index: int, create_bot, build_dispatcher, init, updates, events, metrics=None):
+    # init до open_db: в нём настраивается и пул соединений
+    if init is not None:
+        init()
+    # Схему уже создал init_db в процессе-приёмнике; здесь только своё подключение
+    await open_db()
+    bot = create_bot()
+    dp = build_dispatcher(bot)
+    # Метрики хендлеров копятся в памяти воркера, поэтому у каждого свой /metrics
+    metrics_runner = await start_metrics_server(*metrics) if metrics is not None else None
+    # Изменения, о которых должны узнать приёмник (планировщик) и соседние воркеры (кэш пользователей)
+    on_reminder_scheduled(lambda reminder_dt: events.put(("reminder", reminder_dt)))
+    on_user_changed(lambda tg_id: events.put(("user", tg_id)))
+
+    incoming = _start_forwarding(updates)
+    # Последняя задача по каждому чату: следующий апдейт чата ждёт предыдущий
+    chains: Dict[int, asyncio.Task] = {}
+
+    async def process(previous: Optional[asyncio.Task], raw: dict):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await dp.feed_raw_update(bot, raw)
+
+    def release(key: int, task: asyncio.Task):
+        if chains.get(key) is task:
+            del chains[key]
+
+    print(f"👷 Воркер {index} запущен")
+    try:
+        while True:
+            item = await incoming.get()
+            if item is None:
+                break
+            kind, key, payload = item
+            if kind == "user":
+                forget_cached_user(payload)
+                continue
+            task = asyncio.create_task(process(chains.get(key), payload))
+            chains[key] = task
+            task.add_done_callback(partial(release, key))
+        if chains:
+            await asyncio.gather(*chains.values(), return_exceptions=True)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        shutdown_executor()
+        await close_db()
+
+
+# ======================
+# ПРИЁМНИК
+# ======================
+
+class UpdateFanout:
+    """Получает апдейты long polling'ом и раздаёт их N процессам-воркерам по chat id.
+
+    Каждый воркер создаёт своего бота через create_bot(), Dispatcher через build_dispatcher(bot)
+    и своё подключение к tasks.db
+    (WAL + busy_timeout, записи — в транзакциях BEGIN IMMEDIATE). Напоминания отправляет только приёмник.
+    """
+
+    def __init__(self, create_bot: Callable[[], Bot], build_dispatcher: Callable[[Bot], Dispatcher], workers: int,
+                 init: Optional[Callable[[], None]] = None,
+                 on_reminder: Optional[Callable[[str], None]] = None,
+                 metrics_host: str = "127.0.0.1", metrics_port: Optional[int] = None):
+        if workers < 1:
+            raise ValueError("Нужен хотя бы один воркер")
+        self.create_bot = create_bot
+        self.build_dispatcher = build_dispatcher
+        self.init = init
+        self.on_reminder = on_reminder
+        # Воркер i отдаёт свои метрики на metrics_port + i
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self._ctx = multiprocessing.get_context("spawn")
+        self._events = self._ctx.Queue()
+        self._queues = [self._ctx.Queue() for _ in range(workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+
+    def _spawn(self, index: int):
+        metrics = (self.metrics_host, self.metrics_port + index) if self.metrics_port else None
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.create_bot, self.build_dispatcher, self.init, self._queues[index], self._events,
+                  metrics),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _ensure_alive(self, index: int):
+        process = self._processes[index]
+        if process is None or not process.is_alive():
+            if process is not None:
+                print(f"⚠️ Воркер {index} завершился (код {process.exitcode}), перезапускаю")
+            self._spawn(index)
+
+    def dispatch(self, update: Update):
+        key = route_key(update)
+        index = abs(key) % len(self._queues)
+        self._ensure_alive(index)
+        self._queues[index].put(("update", key, update.model_dump(mode="json", exclude_unset=True)))
+
+    async def _pump_events(self, events: asyncio.Queue):
+        while True:
+            item = await events.get()
+            if item is None:
+                return
+            kind, payload = item
+            if kind == "reminder" and self.on_reminder is not None:
+                self.on_reminder(payload)
+            elif kind == "user":
+                for queue in self._queues:
+                    queue.put(("user", None, payload))
+
+    async def run(self, bot: Bot, allowed_updates: Optional[List[str]] = None):
+        for index in range(len(self._queues)):
+            self._spawn(index)
+        events_task = asyncio.create_task(self._pump_events(_start_forwarding(self._events)))
+        offset = None
+        backoff = 1
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates,
+                        request_timeout=POLL_TIMEOUT + 10,
+                    )
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except Exception as e:
+                    # Как dp.start_polling: 5xx Telegram, сеть и прочие ошибки не останавливают бота.
+                    # Цикл завершает только CancelledError (она не Exception)
+                    print(f"⚠️ Ошибка получения апдейтов: {type(e).__name__}: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                backoff = 1
+                for update in updates:
+                    self.dispatch(update)
+                    offset = update.update_id + 1
+        finally:
+            await self.stop()
+            self._events.put(None)
+            await events_task
+            await bot.session.close()
+
+    async def stop(self):
+        for queue in self._queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()